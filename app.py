@@ -1,85 +1,161 @@
 from shiny import App, ui, render, reactive
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import os
 import json
+import threading
+import time
 
-# Chemins des fichiers CSV
-DATA_DIR = "data"
-STOCK_FILE = os.path.join(DATA_DIR, "stock.csv")
-VENTES_FILE = os.path.join(DATA_DIR, "ventes.csv")
+from stockage import creer_stockage
+from magasin import Magasin, CRITIQUE, FAIBLE, NORMAL, position_jeton
+import tableaux
+import importation
 
-# Création du répertoire de données s'il n'existe pas
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+# Backend de persistance : "csv" (réécriture complète à chaque opération),
+# "journal" (ajout en fin de journal, compaction périodique) ou "sqlite"
+PERSISTENCE_MODE = os.environ.get("STOCK_PERSISTENCE", "csv")
+
+# Écriture différée ("1") : les opérations sont écrites par un fil en arrière-plan,
+# regroupées par rafales, au lieu de bloquer l'interface à chaque mutation
+ECRITURE_DIFFEREE = os.environ.get("STOCK_ECRITURE_DIFFEREE", "0") == "1"
+
+# Chargement des données : "immediat" (à l'import du module), "differe" (à l'ouverture
+# de la première session) ou "prechauffe" (dans un fil lancé à l'import, sans le bloquer)
+CHARGEMENT = os.environ.get("STOCK_CHARGEMENT", "immediat")
+
+stockage = creer_stockage(PERSISTENCE_MODE, differe=ECRITURE_DIFFEREE)
 
 def save_data(stock_df, ventes_df):
     """
-    Sauvegarde les DataFrames de stock et de ventes dans des fichiers CSV.
+    Sauvegarde l'état complet du stock et des ventes avec le backend configuré.
     """
-    # Sauvegarder le stock
-    stock_df.to_csv(STOCK_FILE, index=False)
-    
-    # Sauvegarder les ventes
-    ventes_df.to_csv(VENTES_FILE, index=False)
+    stockage.sauvegarder(stock_df, ventes_df)
 
 def load_data():
-    # Structure par défaut des DataFrames
-    stock_structure = {
-        "Categorie": [],
-        "Sous-categorie": [],
-        "Produit": [],
-        "Prix unitaire": [],
-        "Quantite": [],
-        "Date": [],
-        "Quantite_initiale": []
-    }
-    
-    ventes_structure = {
-        "Categorie": [],
-        "Sous-categorie": [],
-        "Produit": [],
-        "Prix unitaire": [],
-        "Quantite vendue": [],
-        "Date": [],
-        "Total": []
-    }
-    
-    # Charger les données du stock
-    if os.path.exists(STOCK_FILE):
-        stock_df = pd.read_csv(STOCK_FILE)
-        stock_df = stock_df.fillna(0)
-        if "Prix unitaire" in stock_df.columns:
-            stock_df["Prix unitaire"] = stock_df["Prix unitaire"].astype(float)
-        if "Quantite" in stock_df.columns:
-            stock_df["Quantite"] = stock_df["Quantite"].astype(float)
-        if "Quantite_initiale" in stock_df.columns:
-            stock_df["Quantite_initiale"] = stock_df["Quantite_initiale"].astype(float)
-    else:
-        stock_df = pd.DataFrame(stock_structure)  # Créer un DataFrame vide avec la structure par défaut
-    
-    # Charger les données des ventes
-    if os.path.exists(VENTES_FILE):
-        ventes_df = pd.read_csv(VENTES_FILE)
-        ventes_df = ventes_df.fillna(0)
-        if "Date" in ventes_df.columns:
-            # Utiliser format='mixed' pour gérer les dates au format "%d/%m/%Y" ou "%d-%m-%Y"
-            ventes_df["Date"] = pd.to_datetime(ventes_df["Date"], format='mixed', dayfirst=True)
-    else:
-        ventes_df = pd.DataFrame(ventes_structure)  # Créer un DataFrame vide avec la structure par défaut
-    
     # Retourner les deux DataFrames
-    return stock_df, ventes_df
+    return stockage.charger()
+
+# Magasin partagé par toutes les sessions : une seule copie des données par processus.
+# Chaque mutation y est persistée (réécriture complète des CSV en mode "csv",
+# une ligne de journal en mode "journal", une transaction d'une ligne en mode "sqlite").
+magasin = None
+verrou_chargement = threading.Lock()
+
+def obtenir_magasin():
+    """
+    Retourne le magasin partagé, en chargeant les données au premier appel
+    (les appels concurrents attendent la fin de ce chargement unique).
+    """
+    global magasin
+    with verrou_chargement:
+        if magasin is None:
+            debut = time.perf_counter()
+            stock, ventes = load_data()
+            magasin = Magasin(stockage, stock, ventes)
+            # Une ligne de résumé plutôt que l'affichage complet des DataFrames
+            print(
+                f"Données chargées (mode {PERSISTENCE_MODE}) : {len(stock)} lignes de stock, "
+                f"{len(ventes)} ventes en {time.perf_counter() - debut:.2f} s",
+                flush=True,
+            )
+        return magasin
+
+def prechauffer():
+    """
+    Lance le chargement des données dans un fil en arrière-plan : le processus
+    répond tout de suite, la première session attend la fin du chargement.
+    """
+    threading.Thread(target=obtenir_magasin, name="prechauffage", daemon=True).start()
+
+if CHARGEMENT == "immediat":
+    obtenir_magasin()
+elif CHARGEMENT == "prechauffe":
+    prechauffer()
 
-# Charger les données initiales
-initial_stock, initial_ventes = load_data()
+# Intervalle (en secondes) auquel une session vérifie si une autre a publié une nouvelle version
+INTERVALLE_SYNCHRONISATION = 1
 
-# Afficher les données chargées
-print("Stock initial :")
-print(initial_stock)
+# Nombre d'essais d'une vente ou d'un import quand une autre session publie entre-temps
+TENTATIVES_PUBLICATION = 5
+
+MESSAGE_CONFLIT = "Les données viennent d'être modifiées par une autre session : l'affichage est mis à jour, veuillez recommencer."
+
+# Tailles de page proposées pour les tableaux paginés ("Tout" = pas de pagination)
+TAILLES_PAGE = ["25", "50", "100", "250", "Tout"]
+
+def paginer(nb_lignes, page, taille_page):
+    """
+    Retourne (debut, fin, page, nb_pages) pour afficher la page demandée,
+    ramenée dans l'intervalle des pages existantes.
+    """
+    if taille_page is None or taille_page <= 0:
+        return 0, nb_lignes, 1, 1
+    nb_pages = max(1, -(-nb_lignes // taille_page))
+    page = min(max(1, page), nb_pages)
+    debut = (page - 1) * taille_page
+    return debut, min(debut + taille_page, nb_lignes), page, nb_pages
+
+def lire_taille_page(valeur):
+    return None if valeur in (None, "", "Tout") else int(valeur)
+
+def cle_tri(serie):
+    # Une catégorie pandas se trie par code : ordonner d'abord son dictionnaire alphabétiquement
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.reorder_categories(sorted(serie.cat.categories, key=str), ordered=True)
+    return serie
+
+# Nombre maximal de lignes rejetées détaillées dans le rapport d'import
+MAX_REJETS_AFFICHES = 200
+
+def rapport_import(resume, rejets):
+    """
+    Rapport d'un import en masse : résumé, puis tableau des lignes rejetées et de leur motif.
+    """
+    if rejets.empty:
+        return ui.div({"class": "alert alert-success"}, resume)
+    affiches = rejets.head(MAX_REJETS_AFFICHES)
+    suite = f"<p>… et {len(rejets) - len(affiches)} autres lignes rejetées.</p>" if len(rejets) > len(affiches) else ""
+    return ui.div(
+        {"class": "alert alert-warning"},
+        ui.p(f"{resume} {len(rejets)} lignes rejetées :"),
+        ui.HTML(tableaux.tableau_html(
+            ["Ligne", "Catégorie", "Produit", "Motif"],
+            [
+                tableaux.nombre(affiches["Ligne"]),
+                tableaux.texte(affiches["Categorie"]),
+                tableaux.texte(affiches["Produit"]),
+                tableaux.texte(affiches["Motif"]),
+            ],
+        ) + suite),
+    )
 
-print("\nVentes initiales :")
-print(initial_ventes)
+# Périodes prédéfinies (boutons du tableau de bord, filtre de l'historique des ventes)
+PERIODES = {
+    "tout": "Tout",
+    "aujourd_hui": "Aujourd'hui",
+    "cette_semaine": "Cette semaine",
+    "ce_mois": "Ce mois",
+    "ce_trimestre": "Ce trimestre",
+    "cette_annee": "Cette année",
+}
+
+def debut_periode(periode, today):
+    """
+    Premier jour de la période prédéfinie qui se termine aujourd'hui, ou None pour "tout".
+    """
+    if periode == "aujourd_hui":
+        return today
+    if periode == "cette_semaine":
+        return today - timedelta(days=today.weekday())
+    if periode == "ce_mois":
+        return today.replace(day=1)
+    if periode == "ce_trimestre":
+        current_quarter = ((today.month - 1) // 3) + 1
+        return today.replace(month=(current_quarter - 1) * 3 + 1, day=1)
+    if periode == "cette_annee":
+        return today.replace(month=1, day=1)
+    return None
 
 # Interface utilisateur
 app_ui = ui.page_fluid(
@@ -277,7 +353,8 @@ app_ui = ui.page_fluid(
     """),
     ui.div(
         {"class": "navbar"},
-        ui.h1("Gestion de Stock et Ventes")
+        ui.h1("Gestion de Stock et Ventes"),
+        ui.output_ui("modifications_en_attente")
     ),
     ui.navset_tab(
         ui.nav_panel("Stock",
@@ -343,10 +420,31 @@ app_ui = ui.page_fluid(
                             ui.input_numeric("quantite", "Quantité", value=0, min=0, step=1)
                         ),
                         ui.input_action_button("ajouter", "Ajouter", class_="btn-primary"),
-                        ui.output_text("message_confirmation")
+                        ui.output_text("message_confirmation"),
+                        ui.hr(),
+                        ui.input_file("fichier_stock", "Réception fournisseur (CSV ou Excel)", accept=[".csv", ".xlsx", ".xls"]),
+                        ui.output_ui("rapport_import_stock")
                     ),
                     ui.column(8, 
-                        ui.output_ui("tableau_stock")
+                        ui.row(
+                            ui.column(4, ui.input_text("recherche_stock", "Rechercher", placeholder="Catégorie, sous-catégorie ou produit...")),
+                            ui.column(3, ui.input_select("tri_stock", "Trier par", choices={
+                                "": "Ordre d'ajout",
+                                "Categorie": "Catégorie",
+                                "Sous-categorie": "Sous-catégorie",
+                                "Produit": "Produit",
+                                "Prix unitaire": "Prix unitaire",
+                                "Quantite": "Quantité",
+                            })),
+                            ui.column(2, ui.input_select("ordre_stock", "Ordre", choices={"asc": "Croissant", "desc": "Décroissant"})),
+                            ui.column(3, ui.input_select("taille_page_stock", "Lignes par page", choices=TAILLES_PAGE, selected="50")),
+                        ),
+                        ui.output_ui("tableau_stock"),
+                        ui.div(
+                            ui.input_action_button("page_precedente_stock", "◀ Précédent", class_="btn-secondary m-1"),
+                            ui.output_text("pagination_stock", inline=True),
+                            ui.input_action_button("page_suivante_stock", "Suivant ▶", class_="btn-secondary m-1"),
+                        )
                     )
                 )
             )
@@ -378,10 +476,27 @@ app_ui = ui.page_fluid(
                             ui.input_numeric("quantite_vendue", "Quantité", value=0, min=0, step=1)
                         ),
                         ui.input_action_button("vendre", "Vendre", class_="btn-primary"),
-                        ui.output_text("message_vente_text")
+                        ui.input_action_button("ajouter_panier", "Ajouter au panier", class_="btn-secondary"),
+                        ui.output_text("message_vente_text"),
+                        ui.h4("Panier"),
+                        ui.output_ui("panier"),
+                        ui.input_action_button("valider_panier", "Valider", class_="btn-primary"),
+                        ui.input_action_button("vider_panier", "Vider", class_="btn-secondary"),
+                        ui.hr(),
+                        ui.input_file("fichier_ventes", "Importer des ventes (CSV ou Excel)", accept=[".csv", ".xlsx", ".xls"]),
+                        ui.output_ui("rapport_import_ventes")
                     ),
                     ui.column(8,
-                        ui.output_ui("tableau_vente")
+                        ui.row(
+                            ui.column(3, ui.input_select("periode_vente", "Période", choices=PERIODES, selected="tout")),
+                            ui.column(3, ui.input_select("taille_page_vente", "Lignes par page", choices=TAILLES_PAGE, selected="50")),
+                        ),
+                        ui.output_ui("tableau_vente"),
+                        ui.div(
+                            ui.input_action_button("page_precedente_vente", "◀ Précédent", class_="btn-secondary m-1"),
+                            ui.output_text("pagination_vente", inline=True),
+                            ui.input_action_button("page_suivante_vente", "Suivant ▶", class_="btn-secondary m-1"),
+                        )
                     )
                 )
             )
@@ -390,6 +505,10 @@ app_ui = ui.page_fluid(
             ui.div(
                 {"class": "card"},
                 ui.h2("Tableau de Bord"),
+                ui.row(
+                    ui.column(6, ui.output_text("total_stock")),
+                    ui.column(6, ui.output_text("total_ventes")),
+                ),
                 ui.row(
                     ui.column(2, ui.input_select("categorie_analyse", "Catégorie", choices=["Tous"])),
                     ui.column(2, ui.input_select("sous_categorie_analyse", "Sous-catégorie", choices=["Tous"])),
@@ -461,20 +580,107 @@ app_ui = ui.page_fluid(
 )
 # Serveur
 def server(input, output, session):
+    # Données chargées par la première session si elles ne l'ont pas encore été
+    magasin = obtenir_magasin()
+    
     # Variables réactives pour stocker les messages
     message_stock = reactive.Value("")
     message_vente = reactive.Value("")
+    rapport_ventes = reactive.Value(None)
+    rapport_stock = reactive.Value(None)
+    # Panier de la session : lignes de vente en attente de validation
+    lignes_panier = reactive.Value([])
 
-    stock_data = reactive.Value(initial_stock.copy())
-    vente_data = reactive.Value(initial_ventes.copy())
+    # La session ne garde qu'un pointeur vers la version du magasin partagé
+    version_courante = reactive.Value(magasin.version)
 
-def server(input, output, session):
-    # Variables réactives pour stocker les messages
-    message_stock = reactive.Value("")
-    message_vente = reactive.Value("")
+    @reactive.Effect
+    def suivre_magasin():
+        # Rattraper les versions publiées par les autres sessions
+        reactive.invalidate_later(INTERVALLE_SYNCHRONISATION)
+        with reactive.isolate():
+            if magasin.version != version_courante():
+                version_courante.set(magasin.version)
 
-    stock_data = reactive.Value(initial_stock.copy())
-    vente_data = reactive.Value(initial_ventes.copy())
+    @reactive.Calc
+    def stock_et_jetons():
+        # Stock et jetons de ligne d'une même version : les actions du tableau envoient le
+        # jeton de la ligne affichée, qui ne désigne plus rien si elle a changé depuis
+        version_courante()
+        return magasin.lire_stock()
+
+    @reactive.Calc
+    def stock_data():
+        return stock_et_jetons()[0]
+
+    def ligne_affichee(jeton):
+        # Ligne du stock de la session portant ce jeton, ou None
+        stock, jetons = stock_et_jetons()
+        position = position_jeton(jetons, jeton)
+        return stock.iloc[position] if position is not None else None
+
+    # Dernier événement d'alerte déjà notifié dans la session
+    dernier_evenement_alerte = reactive.Value(magasin.alertes.sequence)
+
+    @reactive.Effect
+    def notifier_alertes():
+        # Franchissements de seuil publiés depuis la dernière version vue (toutes sessions)
+        stock_data()
+        with reactive.isolate():
+            evenements = magasin.evenements_alerte(dernier_evenement_alerte())
+            if evenements:
+                dernier_evenement_alerte.set(evenements[-1]["sequence"])
+        for evenement in evenements:
+            produit = f"{evenement['produit']} ({evenement['categorie']})"
+            if evenement["niveau"] == CRITIQUE:
+                ui.notification_show(f"{produit} est passé en stock critique.", type="error", duration=10)
+            elif evenement["niveau"] == FAIBLE and evenement["ancien"] == NORMAL:
+                ui.notification_show(f"{produit} est passé en stock faible.", type="warning", duration=10)
+            elif evenement["niveau"] == FAIBLE:
+                ui.notification_show(f"{produit} n'est plus en stock critique (stock faible).", type="message")
+            else:
+                ui.notification_show(f"{produit} n'est plus en alerte de stock.", type="message")
+
+    @reactive.Calc
+    def ventes_et_jetons():
+        # Ventes et jetons d'une même version (l'action de suppression envoie le jeton de la vente)
+        version_courante()
+        return magasin.lire_ventes()
+
+    @reactive.Calc
+    def vente_data():
+        return ventes_et_jetons()[0]
+
+    def publier_sur_derniere_version(calculer):
+        """
+        Applique calculer(stock, ventes) -> (stock, ventes, operation, ...) à la
+        dernière version du magasin et publie le résultat si aucune autre session
+        n'a publié entre-temps ; sinon recommence sur la nouvelle version.
+        Retourne le résultat de calculer (operation None : rien à publier), ou
+        None si toutes les tentatives ont échoué.
+        """
+        for _ in range(TENTATIVES_PUBLICATION):
+            version, stock, ventes = magasin.lire()
+            resultat = calculer(stock, ventes)
+            operation = resultat[2]
+            if operation is None:
+                return resultat
+            nouvelle_version = magasin.publier(resultat[0], resultat[1], operation[0], version_attendue=version, **operation[1])
+            if nouvelle_version is not None:
+                version_courante.set(nouvelle_version)
+                return resultat
+        version_courante.set(magasin.version)
+        return None
+
+    # Hiérarchie catégorie -> sous-catégorie -> produit, construite une fois par version du catalogue
+    @reactive.Calc
+    def hierarchie():
+        stock_data()
+        return magasin.hierarchie()
+
+    def sans_tous(valeur):
+        # "Tous" (ou vide) signifie : pas de filtre sur ce niveau
+        return None if not valeur or valeur == "Tous" else valeur
 
     # Réinitialiser les champs au démarrage
     @reactive.Effect
@@ -485,108 +691,80 @@ def server(input, output, session):
         ui.update_numeric("prix_unitaire", value=0)  # Réinitialiser le prix unitaire à 0
         ui.update_numeric("quantite", value=0)  # Réinitialiser la quantité à 0
 
-    @reactive.Effect
-    def update_categorie_choices():
-        stock = stock_data()
-        if not stock.empty:
-            categories = stock["Categorie"].unique().tolist()
-            ui.update_selectize("categorie", choices=categories, server=True)
+    # Listes de choix déjà envoyées au navigateur, par contrôle
+    choix_envoyes = {}
+    # Hiérarchie et sélections de la dernière passe du coordinateur
+    derniere_passe = [None]
 
-    @reactive.Effect
-    def update_sous_categorie_choices():
-        stock = stock_data()
-        if not stock.empty and input.categorie():
-            sous_categories = stock[stock["Categorie"] == input.categorie()]["Sous-categorie"].unique().tolist()
-            ui.update_selectize("sous_categorie", choices=sous_categories, server=True)
+    def envoyer_choix(identifiant, choix, selection=None, selectize=False, toujours=False):
+        """
+        Envoie la liste de choix d'un contrôle seulement si elle diffère de la
+        dernière envoyée (ou si `toujours`), avec la sélection donnée.
+        """
+        if not toujours and choix_envoyes.get(identifiant) == choix:
+            return
+        choix_envoyes[identifiant] = choix
+        if selectize:
+            ui.update_selectize(identifiant, choices=choix, selected=selection, server=True)
+        else:
+            ui.update_select(identifiant, choices=choix, selected=selection)
+
+    def garder(selection, choix, defaut="Tous"):
+        # Sélection conservée si elle fait toujours partie des choix
+        return selection if selection in choix else defaut
 
+    # Coordinateur des listes déroulantes : une seule passe par changement du catalogue
+    # ou d'une sélection, et un message seulement pour les contrôles dont la liste a changé
     @reactive.Effect
-    def update_produit_choices():
-        stock = stock_data()
-        if not stock.empty and input.categorie() and input.sous_categorie():
-            produits = stock[
-                (stock["Categorie"] == input.categorie()) & 
-                (stock["Sous-categorie"] == input.sous_categorie())
-            ]["Produit"].unique().tolist()
-            ui.update_selectize("produit", choices=produits, server=True)
-
-    # Variable réactive pour suivre l'index du produit en cours de modification
+    def coordonner_listes():
+        hier = hierarchie()
+        selections = tuple(input[identifiant]() for identifiant in (
+            "categorie", "sous_categorie",
+            "categorie_vente", "sous_categorie_vente", "produit_vente",
+            "categorie_analyse", "sous_categorie_analyse", "produit_analyse",
+        ))
+        # Une vente ne change pas le catalogue : même hiérarchie, rien à recalculer
+        if hier.vide() or derniere_passe[0] == (hier, selections):
+            return
+        derniere_passe[0] = (hier, selections)
+        
+        # Formulaire de stock (saisie libre) : listes filtrées par les valeurs tapées
+        categories = hier.categories()
+        envoyer_choix("categorie", categories, selectize=True)
+        if input.categorie():
+            envoyer_choix("sous_categorie", hier.sous_categories(input.categorie()), selectize=True)
+            if input.sous_categorie():
+                envoyer_choix("produit", hier.produits(input.categorie(), input.sous_categorie()), selectize=True)
+        
+        # Vente et analyse : "Tous" en premier ; la sous-catégorie n'est prise en compte
+        # que si une catégorie est choisie
+        for onglet in ("vente", "analyse"):
+            choix = ["Tous"] + categories
+            categorie = garder(input[f"categorie_{onglet}"](), choix)
+            envoyer_choix(f"categorie_{onglet}", choix, categorie)
+            
+            choix = ["Tous"] + hier.sous_categories(sans_tous(categorie))
+            sous_categorie = garder(input[f"sous_categorie_{onglet}"](), choix)
+            envoyer_choix(f"sous_categorie_{onglet}", choix, sous_categorie)
+            
+            choix = ["Tous"] + hier.produits(
+                sans_tous(categorie), sans_tous(sous_categorie) if sans_tous(categorie) else None
+            )
+            envoyer_choix(f"produit_{onglet}", choix, garder(input[f"produit_{onglet}"](), choix))
+
+    # Variable réactive pour suivre le jeton de la ligne en cours de modification
     produit_en_modification = reactive.Value(None)
 
     # Fonction réactive pour obtenir les catégories
     @reactive.Calc
     def get_categories():
-        return ["Tous"] + stock_data()["Categorie"].unique().tolist()
+        return ["Tous"] + hierarchie().categories()
     
-    @reactive.Effect
-    def update_categorie_analyse():
-        stock = stock_data()
-        if not stock.empty:
-            categories = ["Tous"] + stock["Categorie"].unique().tolist()
-            ui.update_select("categorie_analyse", choices=categories)
-        
-    # Mise à jour des sous-catégories pour l'analyse
-    @reactive.Effect
-    @reactive.event(input.categorie_analyse)
-    def update_sous_categorie_analyse():
-        stock = stock_data()
-        if not stock.empty and input.categorie_analyse():
-            if input.categorie_analyse() == "Tous":
-                sous_categories = ["Tous"] + stock["Sous-categorie"].unique().tolist()
-            else:
-                sous_categories = ["Tous"] + stock[stock["Categorie"] == input.categorie_analyse()]["Sous-categorie"].unique().tolist()
-            ui.update_select("sous_categorie_analyse", choices=sous_categories)
-    
-    # Mise à jour des produits pour l'analyse
-    @reactive.Effect
-    @reactive.event(input.sous_categorie_analyse)
-    def update_produit_analyse():
-        stock = stock_data()
-        if not stock.empty and input.categorie_analyse() and input.sous_categorie_analyse():
-            if input.categorie_analyse() == "Tous" and input.sous_categorie_analyse() == "Tous":
-                produits = ["Tous"] + stock["Produit"].unique().tolist()
-            elif input.categorie_analyse() == "Tous":
-                produits = ["Tous"] + stock[stock["Sous-categorie"] == input.sous_categorie_analyse()]["Produit"].unique().tolist()
-            elif input.sous_categorie_analyse() == "Tous":
-                produits = ["Tous"] + stock[stock["Categorie"] == input.categorie_analyse()]["Produit"].unique().tolist()
-            else:
-                produits = ["Tous"] + stock[
-                    (stock["Categorie"] == input.categorie_analyse()) &
-                    (stock["Sous-categorie"] == input.sous_categorie_analyse())
-                ]["Produit"].unique().tolist()
-            ui.update_select("produit_analyse", choices=produits)
-            
-    # Mise à jour des sous-catégories en fonction de la catégorie sélectionnée
-    @reactive.Effect
-    def update_sous_categories():
-        stock = stock_data()
-        if input.categorie_analyse():
-            sous_categories = stock[stock["Categorie"] == input.categorie_analyse()]["Sous-categorie"].unique().tolist()
-            ui.update_select("sous_categorie_analyse", choices=[""] + sous_categories)
-        else:
-            ui.update_select("sous_categorie_analyse", choices=[])
-
-    # Mise à jour des produits en fonction de la catégorie et de la sous-catégorie sélectionnées
-    @reactive.Effect
-    def update_produits():
-        stock = stock_data()
-        if input.categorie_analyse() and input.sous_categorie_analyse():
-            produits = stock[
-                (stock["Categorie"] == input.categorie_analyse()) &
-                (stock["Sous-categorie"] == input.sous_categorie_analyse())
-            ]["Produit"].unique().tolist()
-            ui.update_select("produit_analyse", choices=[""] + produits)
-        else:
-            ui.update_select("produit_analyse", choices=[])
-
     # Ajout de produit au stock
     @reactive.Effect
     @reactive.event(input.ajouter)  # Déclenché lorsque le bouton "ajouter" est cliqué
     def ajouter_produit():
         print("Bouton ajouter cliqué")
-        stock = stock_data()
-        
-        # Remplacer NaN par 0 dans le DataFrame
-        stock = stock.fillna(0)
         
         # Validation des champs obligatoires
         if not input.categorie() or not input.produit():
@@ -598,58 +776,51 @@ def server(input, output, session):
             message_stock.set("Le prix et la quantité doivent être positifs.")
             return
         
-        # Récupérer l'index du produit en cours de modification
-        index_modification = produit_en_modification()
+        # Récupérer le jeton de la ligne en cours de modification
+        jeton_modification = produit_en_modification()
+        
+        # Date du jour en datetime64 : mise en forme seulement à l'affichage et à la sauvegarde
+        aujourd_hui = pd.Timestamp(datetime.now().date())
         
-        if index_modification is not None:
+        if jeton_modification is not None:
             # Si un produit est en cours de modification, remplacer la quantité
-            stock.loc[index_modification] = {
+            ligne = {
                 "Categorie": input.categorie(),
                 "Sous-categorie": input.sous_categorie(),
                 "Produit": input.produit(),
                 "Prix unitaire": input.prix_unitaire(),
                 "Quantite": input.quantite(),  # Remplace la quantité existante
-                "Date": datetime.now().strftime("%d-%m-%Y"),  # Format "dd-mm-yyyy"
+                "Date": aujourd_hui,
                 "Quantite_initiale": input.quantite()  # Mise à jour de la quantité initiale
             }
-            message_stock.set(f"Produit {input.produit()} modifié avec succès.")
-            # Réinitialiser l'indicateur de modification
+            # Remplacer la ligne dans le stock partagé, seulement si elle n'a pas changé
+            # depuis le début de la modification (jeton) ; sinon recommencer la modification
+            version = magasin.modifier_ligne(jeton_modification, ligne)
+            version_courante.set(version if version is not None else magasin.version)
             produit_en_modification.set(None)
+            if version is None:
+                message_stock.set(MESSAGE_CONFLIT)
+                return
+            message_stock.set(f"Produit {input.produit()} modifié avec succès.")
         else:
-            # Vérifier si un produit avec les mêmes valeurs existe déjà
-            mask = (
-                (stock["Categorie"] == input.categorie()) &
-                (stock["Sous-categorie"] == input.sous_categorie()) &
-                (stock["Produit"] == input.produit()) &
-                (stock["Prix unitaire"] == input.prix_unitaire())
-            )
-            existing = stock[mask]
-            
-            if not existing.empty:
-                # Si un produit correspondant existe, ajouter la quantité
-                index = existing.index[0]
-                stock.loc[index, "Quantite"] += input.quantite()
-                message_stock.set(f"Quantité du produit {input.produit()} mise à jour. Nouvelle quantité : {stock.loc[index, 'Quantite']}")
+            new_row = pd.DataFrame({
+                "Categorie": [input.categorie()],
+                "Sous-categorie": [input.sous_categorie()],
+                "Produit": [input.produit()],
+                "Prix unitaire": [input.prix_unitaire()],
+                "Quantite": [input.quantite()],
+                "Date": [aujourd_hui],
+                "Quantite_initiale": [input.quantite()]
+            })
+            # Si un produit avec les mêmes valeurs existe déjà (index de hachage du magasin), ajouter
+            # la quantité, sinon ajouter un nouveau produit ; clé cherchée et ligne lue dans la même version
+            version, quantite = magasin.ajouter_produit(new_row)
+            version_courante.set(version)
+            if quantite is not None:
+                message_stock.set(f"Quantité du produit {input.produit()} mise à jour. Nouvelle quantité : {quantite}")
             else:
-                # Si aucun produit correspondant n'existe, ajouter un nouveau produit
-                new_row = pd.DataFrame({
-                    "Categorie": [input.categorie()],
-                    "Sous-categorie": [input.sous_categorie()],
-                    "Produit": [input.produit()],
-                    "Prix unitaire": [input.prix_unitaire()],
-                    "Quantite": [input.quantite()],
-                    "Date": [datetime.now().strftime("%d-%m-%Y")],  # Format "dd-mm-yyyy"
-                    "Quantite_initiale": [input.quantite()]
-                })
-                stock = pd.concat([stock, new_row], ignore_index=True)
                 message_stock.set(f"Produit {input.produit()} ajouté au stock.")
         
-        # Mettre à jour les données de stock
-        stock_data.set(stock)
-
-        # Sauvegarder les données
-        save_data(stock, vente_data())
-        
         # Réinitialiser tous les champs pour que l'interface reste vierge
         ui.update_selectize("categorie", selected="")  # Réinitialiser la catégorie
         ui.update_selectize("sous_categorie", selected="")  # Réinitialiser la sous-catégorie
@@ -661,9 +832,6 @@ def server(input, output, session):
     @reactive.Effect
     @reactive.event(input.vendre)
     def enregistrer_vente():
-        stock = stock_data()
-        ventes = vente_data()
-        
         # Vérifier que tous les champs sont remplis
         if not input.categorie_vente() or not input.produit_vente():
             message_vente.set("Veuillez sélectionner une catégorie et un produit.")
@@ -674,135 +842,60 @@ def server(input, output, session):
             message_vente.set("La quantité vendue doit être positive.")
             return
         
-        # Trouver le produit dans le stock
-        mask_stock = (
-            (stock["Categorie"] == input.categorie_vente()) & 
-            (stock["Produit"] == input.produit_vente())
-        )
-        produit_stock = stock[mask_stock]
-        
-        # Vérifier si le produit existe en stock et en quantité suffisante
-        if len(produit_stock) == 0:
-            message_vente.set("Produit non trouvé en stock.")
-            return
-        
-        stock_index = produit_stock.index[0]
-        quantite_disponible = stock.loc[stock_index, "Quantite"]
-        prix_unitaire_stock = stock.loc[stock_index, "Prix unitaire"]
-        
-        # Utiliser le prix unitaire saisi ou le prix du stock si non spécifié
-        prix_unitaire_vente = input.prix_unitaire_vente() if input.prix_unitaire_vente() > 0 else prix_unitaire_stock
-        
-        if input.quantite_vendue() > quantite_disponible:
-            message_vente.set(f"Quantité insuffisante. Stock disponible : {quantite_disponible}")
-            return
-        
-        # Mettre à jour le stock
-        stock.loc[stock_index, "Quantite"] -= input.quantite_vendue()
-        
-        # S'assurer que la colonne Quantite_initiale existe
-        if "Quantite_initiale" not in stock.columns:
-            stock["Quantite_initiale"] = stock["Quantite"].copy()
-        
-        # Ajouter la vente
-        nouvelle_vente = pd.DataFrame({
-            "Categorie": [input.categorie_vente()],
-            "Sous-categorie": [input.sous_categorie_vente() or ""],
-            "Produit": [input.produit_vente()],
-            "Prix unitaire": [float(prix_unitaire_vente)],
-            "Quantite vendue": [float(input.quantite_vendue())],
-            "Date": [datetime.now().strftime("%d-%m-%Y")],  # Format "dd-mm-yyyy"
-            "Total": [float(prix_unitaire_vente * input.quantite_vendue())]
-        })
-        
-        if ventes.empty:
-            ventes = nouvelle_vente
-        else:
-            # Convertir la colonne Date en datetime si ce n'est pas déjà fait
-            if not pd.api.types.is_datetime64_any_dtype(ventes["Date"]):
-                ventes["Date"] = pd.to_datetime(ventes["Date"], format="%d-%m-%Y")
+        # Lire la ligne du produit dans le stock partagé (pas dans la copie de la session,
+        # qui peut avoir une version de retard), puis la décrémenter seulement si elle n'a
+        # pas changé entre-temps ; sinon relire et revérifier la quantité disponible
+        for _ in range(TENTATIVES_PUBLICATION):
+            # Trouver le produit dans le stock (index de hachage du magasin) et lire sa ligne dans la même version
+            lecture = magasin.lire_produit(input.categorie_vente(), input.produit_vente())
             
-            ventes = pd.concat([ventes, nouvelle_vente], ignore_index=True)
-        
-        # Convertir la colonne Date en datetime
-        ventes["Date"] = pd.to_datetime(ventes["Date"], format="%d-%m-%Y")
-        
-        # Mettre à jour les données
-        stock_data.set(stock)
-        vente_data.set(ventes)
-        
-        # Sauvegarder les données
-        save_data(stock, ventes)
+            # Vérifier si le produit existe en stock et en quantité suffisante
+            if lecture is None:
+                message_vente.set("Produit non trouvé en stock.")
+                return
+            
+            stock_index, jeton, produit = lecture
+            quantite_disponible = produit["Quantite"]
+            prix_unitaire_stock = produit["Prix unitaire"]
+            
+            # Utiliser le prix unitaire saisi ou le prix du stock si non spécifié
+            prix_unitaire_vente = input.prix_unitaire_vente() if input.prix_unitaire_vente() > 0 else prix_unitaire_stock
+            
+            if input.quantite_vendue() > quantite_disponible:
+                message_vente.set(f"Quantité insuffisante. Stock disponible : {quantite_disponible}")
+                return
+            
+            # Ajouter la vente
+            nouvelle_vente = pd.DataFrame({
+                "Categorie": [input.categorie_vente()],
+                "Sous-categorie": [input.sous_categorie_vente() or ""],
+                "Produit": [input.produit_vente()],
+                "Prix unitaire": [float(prix_unitaire_vente)],
+                "Quantite vendue": [float(input.quantite_vendue())],
+                "Date": [pd.Timestamp(datetime.now().date())],  # datetime64, comme toute la colonne
+                "Total": [float(prix_unitaire_vente * input.quantite_vendue())]
+            })
+            
+            # Mettre à jour et sauvegarder les données (compare-and-swap sur la ligne)
+            version = magasin.vendre(stock_index, jeton, nouvelle_vente)
+            if version is not None:
+                break
+        else:
+            version_courante.set(magasin.version)
+            message_vente.set(MESSAGE_CONFLIT)
+            return
+        version_courante.set(version)
         
         # Message de confirmation
         message_vente.set(f"{input.quantite_vendue()} {input.produit_vente()} vendus à {prix_unitaire_vente:.2f} Fbu l'unité.")
         
-        # Réinitialiser les champs de vente
-        ui.update_select("categorie_vente", selected="")
-        ui.update_select("sous_categorie_vente", choices=[])
-        ui.update_select("produit_vente", choices=[])
+        # Réinitialiser les champs de vente (les listes suivent par le coordinateur)
+        ui.update_select("categorie_vente", selected="Tous")
+        ui.update_select("sous_categorie_vente", selected="Tous")
+        ui.update_select("produit_vente", selected="Tous")
         ui.update_numeric("prix_unitaire_vente", value=0)
         ui.update_numeric("quantite_vendue", value=1)
 
-    # Mise à jour des catégories pour la vente et l'analyse
-    @reactive.Effect
-    def update_dropdowns():
-        stock = stock_data()
-        
-        if not stock.empty:
-            # Mise à jour des catégories avec "Tous" en premier
-            categories = ["Tous"] + stock["Categorie"].unique().tolist()
-            ui.update_select("categorie_vente", choices=categories, selected="Tous")
-            ui.update_select("categorie_analyse", choices=categories, selected="Tous")
-
-    # Mise à jour des sous-catégories pour la vente et l'analyse
-    @reactive.Effect
-    def update_sous_categorie():
-        stock = stock_data()
-        
-        if not stock.empty:
-            # Filtrer les sous-catégories en fonction de la catégorie sélectionnée
-            if input.categorie_vente():
-                if input.categorie_vente() == "Tous":
-                    sous_categories = ["Tous"] + stock["Sous-categorie"].unique().tolist()
-                else:
-                    sous_categories = ["Tous"] + stock[stock["Categorie"] == input.categorie_vente()]["Sous-categorie"].unique().tolist()
-                ui.update_select("sous_categorie_vente", choices=sous_categories, selected="Tous")
-            
-            if input.categorie_analyse():
-                if input.categorie_analyse() == "Tous":
-                    sous_categories = ["Tous"] + stock["Sous-categorie"].unique().tolist()
-                else:
-                    sous_categories = ["Tous"] + stock[stock["Categorie"] == input.categorie_analyse()]["Sous-categorie"].unique().tolist()
-                ui.update_select("sous_categorie_analyse", choices=sous_categories, selected="Tous")
-
-    # Mise à jour des produits pour la vente et l'analyse
-    @reactive.Effect
-    def update_produits():
-        stock = stock_data()
-        
-        if not stock.empty:
-            # Filtrer les produits en fonction de la catégorie et sous-catégorie sélectionnées
-            if input.categorie_vente():
-                if input.categorie_vente() == "Tous":
-                    produits = ["Tous"] + stock["Produit"].unique().tolist()
-                else:
-                    mask = stock["Categorie"] == input.categorie_vente()
-                    if input.sous_categorie_vente() and input.sous_categorie_vente() != "Tous":
-                        mask &= stock["Sous-categorie"] == input.sous_categorie_vente()
-                    produits = ["Tous"] + stock[mask]["Produit"].unique().tolist()
-                ui.update_select("produit_vente", choices=produits, selected="Tous")
-            
-            if input.categorie_analyse():
-                if input.categorie_analyse() == "Tous":
-                    produits = ["Tous"] + stock["Produit"].unique().tolist()
-                else:
-                    mask = stock["Categorie"] == input.categorie_analyse()
-                    if input.sous_categorie_analyse() and input.sous_categorie_analyse() != "Tous":
-                        mask &= stock["Sous-categorie"] == input.sous_categorie_analyse()
-                    produits = ["Tous"] + stock[mask]["Produit"].unique().tolist()
-                ui.update_select("produit_analyse", choices=produits, selected="Tous")
-
     # Mise à jour du prix unitaire automatiquement
     @reactive.Effect
     def update_prix_unitaire_vente():
@@ -810,13 +903,12 @@ def server(input, output, session):
         if not stock.empty:
             # Mettre à jour le prix unitaire lorsqu'un produit est sélectionné
             if input.categorie_vente() and input.produit_vente():
-                mask = (stock["Categorie"] == input.categorie_vente()) & (stock["Produit"] == input.produit_vente())
-                if input.sous_categorie_vente():
-                    mask &= stock["Sous-categorie"] == input.sous_categorie_vente()
-                
-                produit = stock[mask]
-                if not produit.empty:
-                    prix_unitaire = produit.iloc[0]["Prix unitaire"]
+                # Position et prix lus dans la même version du stock partagé
+                lecture = magasin.lire_produit(
+                    input.categorie_vente(), input.produit_vente(), input.sous_categorie_vente() or None
+                )
+                if lecture is not None:
+                    prix_unitaire = float(lecture[2]["Prix unitaire"])
                     ui.update_numeric("prix_unitaire_vente", value=prix_unitaire)
 
     # Affichage des messages de confirmation
@@ -830,57 +922,91 @@ def server(input, output, session):
     def message_vente_text():
         return message_vente()
 
+    # Pagination du tableau de stock : seule la page visible est rendue et envoyée au navigateur
+    page_stock = reactive.Value(1)
+
+    @reactive.Calc
+    def stock_affiche():
+        # Stock filtré par la recherche puis trié ; l'index garde la position de chaque ligne
+        # dans le stock complet (qui donne son jeton aux actions de suppression et de modification)
+        stock = stock_data()
+        recherche = (input.recherche_stock() or "").strip()
+        if recherche and not stock.empty:
+            masque = pd.Series(False, index=stock.index)
+            for colonne in ("Categorie", "Sous-categorie", "Produit"):
+                serie = stock[colonne]
+                if isinstance(serie.dtype, pd.CategoricalDtype):
+                    # Recherche dans le dictionnaire des valeurs, puis sélection par codes
+                    trouvees = serie.cat.categories.astype(str).str.contains(recherche, case=False, regex=False)
+                    masque |= serie.cat.codes.isin(np.flatnonzero(trouvees))
+                else:
+                    masque |= serie.astype(str).str.contains(recherche, case=False, regex=False)
+            stock = stock[masque]
+        if input.tri_stock():
+            stock = stock.sort_values(
+                input.tri_stock(), ascending=input.ordre_stock() != "desc", kind="stable", key=cle_tri
+            )
+        return stock
+
+    @reactive.Effect
+    @reactive.event(input.recherche_stock, input.tri_stock, input.ordre_stock, input.taille_page_stock)
+    def revenir_premiere_page_stock():
+        page_stock.set(1)
+
+    @reactive.Effect
+    @reactive.event(input.page_precedente_stock)
+    def page_precedente_stock():
+        page_stock.set(max(1, page_stock() - 1))
+
+    @reactive.Effect
+    @reactive.event(input.page_suivante_stock)
+    def page_suivante_stock():
+        _, _, page, _ = paginer(len(stock_affiche()), page_stock() + 1, lire_taille_page(input.taille_page_stock()))
+        page_stock.set(page)
+
+    @output
+    @render.text
+    def pagination_stock():
+        nb_lignes = len(stock_affiche())
+        _, _, page, nb_pages = paginer(nb_lignes, page_stock(), lire_taille_page(input.taille_page_stock()))
+        return f"Page {page} / {nb_pages} ({nb_lignes} produits)"
+
     # Tableau de stock avec boutons d'action
     @output
     @render.ui
     def tableau_stock():
-        stock = stock_data()
+        stock = stock_affiche()
         
         if stock.empty:
+            if (input.recherche_stock() or "").strip():
+                return ui.p("Aucun produit ne correspond à la recherche.")
             return ui.p("Aucun produit en stock pour le moment.")
         
-        # Créer le tableau HTML
-        table_header = """
-        <table class="table">
-            <thead>
-                <tr>
-                    <th>Catégorie</th>
-                    <th>Sous-catégorie</th>
-                    <th>Produit</th>
-                    <th>Prix unitaire</th>
-                    <th>Quantité</th>
-                    <th>Date</th>
-                    <th>Action</th>
-                </tr>
-            </thead>
-            <tbody>
-        """
+        # Ne garder que la page visible
+        debut, fin, _, _ = paginer(len(stock), page_stock(), lire_taille_page(input.taille_page_stock()))
+        stock = stock.iloc[debut:fin]
         
-        table_rows = []
-        for i, row in stock.iterrows():
-            table_row = f"""
-            <tr>
-                <td>{row['Categorie']}</td>
-                <td>{row['Sous-categorie']}</td>
-                <td>{row['Produit']}</td>
-                <td>{row['Prix unitaire']}</td>
-                <td>{row['Quantite']}</td>
-                <td>{row['Date']}</td>
-                <td>
-                    <span class="delete-icon" data-index="{i}" onclick="Shiny.setInputValue('delete', {i}, {{priority: 'event'}});">🗑</span>
-                    <span class="edit-icon" data-index="{i}" onclick="Shiny.setInputValue('modifier', {i}, {{priority: 'event'}});">✏</span>
-                </td>
-            </tr>
-            """
-            table_rows.append(table_row)
-        
-        table_footer = """
-            </tbody>
-        </table>
-        """
-        
-        # Combiner le tableau
-        table_html = table_header + "".join(table_rows) + table_footer
+        # Créer le tableau HTML (mise en forme par colonnes entières) ; les actions envoient le jeton de la ligne
+        jetons = stock_et_jetons()[1][stock.index.to_numpy()]
+        actions = (
+            tableaux.action(jetons, "delete", "🗑", "delete-icon")
+            + " "
+            + tableaux.action(jetons, "modifier", "✏", "edit-icon")
+        )
+        table_html = tableaux.tableau_html(
+            ["Catégorie", "Sous-catégorie", "Produit", "Prix unitaire", "Quantité", "Date", "Action"],
+            [
+                tableaux.texte(stock["Categorie"]),
+                tableaux.texte(stock["Sous-categorie"]),
+                tableaux.texte(stock["Produit"]),
+                tableaux.nombre(stock["Prix unitaire"]),
+                tableaux.nombre(stock["Quantite"]),
+                tableaux.date(stock["Date"]),
+                actions,
+            ],
+            classe="table",
+            responsive=False,
+        )
         
         # Retourner le tableau HTML
         return ui.HTML(table_html)
@@ -889,38 +1015,41 @@ def server(input, output, session):
     @reactive.Effect
     @reactive.event(input.delete)
     def supprimer_produit():
-        index = input.delete()
-        stock = stock_data()
-        if 0 <= index < len(stock):
-            stock = stock.drop(index).reset_index(drop=True)
-            stock_data.set(stock)
-            message_stock.set(f"Produit à l'index {index} supprimé.")
+        jeton = input.delete()
+        produit = ligne_affichee(jeton)
+        # Supprimer la ligne affichée seulement si elle n'a pas changé entre-temps (jeton)
+        version = magasin.supprimer_ligne(jeton)
+        version_courante.set(version if version is not None else magasin.version)
+        if version is None or produit is None:
+            message_stock.set(MESSAGE_CONFLIT)
+            return
+        message_stock.set(f"Produit {produit['Produit']} supprimé.")
 
     # Gérer l'action de modification
     @reactive.Effect
     @reactive.event(input.modifier)
     def modifier_produit():
-        index = input.modifier()
-        stock = stock_data()
-        if 0 <= index < len(stock):
-            produit = stock.iloc[index]
-            # Stocker l'index pour la mise à jour ultérieure
-            produit_en_modification.set(index)
+        jeton = input.modifier()
+        produit = ligne_affichee(jeton)
+        if produit is None:
+            message_stock.set(MESSAGE_CONFLIT)
+        else:
+            # Stocker le jeton de la ligne : la mise à jour sera refusée si elle change entre-temps
+            produit_en_modification.set(jeton)
         
             # D'abord, mettre à jour les choix disponibles dans les listes déroulantes
-            categories = list(stock["Categorie"].unique())
-            ui.update_selectize("categorie", choices=categories, selected=produit["Categorie"])
+            hier = hierarchie()
+            # (envoyées par le coordinateur pour qu'il ne les renvoie pas ensuite)
+            categories = hier.categories()
+            envoyer_choix("categorie", categories, produit["Categorie"], selectize=True, toujours=True)
         
             # Filtrer les sous-catégories correspondant à la catégorie sélectionnée
-            sous_categories = list(stock[stock["Categorie"] == produit["Categorie"]]["Sous-categorie"].unique())
-            ui.update_selectize("sous_categorie", choices=sous_categories, selected=produit["Sous-categorie"])
+            sous_categories = hier.sous_categories(produit["Categorie"])
+            envoyer_choix("sous_categorie", sous_categories, produit["Sous-categorie"], selectize=True, toujours=True)
         
             # Filtrer les produits correspondant à la catégorie et sous-catégorie sélectionnées
-            produits = list(stock[
-                (stock["Categorie"] == produit["Categorie"]) & 
-                (stock["Sous-categorie"] == produit["Sous-categorie"])
-            ]["Produit"].unique())
-            ui.update_selectize("produit", choices=produits, selected=produit["Produit"])
+            produits = hier.produits(produit["Categorie"], produit["Sous-categorie"])
+            envoyer_choix("produit", produits, produit["Produit"], selectize=True, toujours=True)
         
             # Mettre à jour les champs numériques
             ui.update_numeric("prix_unitaire", value=produit["Prix unitaire"])
@@ -929,145 +1058,283 @@ def server(input, output, session):
             message_stock.set(f"Modification du produit {produit['Produit']}.")
 
     
-    # Affichage du tableau des ventes avec quantité restante au stock
-    @output
-    @render.ui
-    def tableau_vente():
-        stock = stock_data()
-        ventes = vente_data()
-
-        # Si le tableau est vide, afficher un message
-        if ventes.empty:
-            return ui.p("Aucune vente enregistrée pour le moment.")
+    # Pagination de l'historique des ventes
+    page_vente = reactive.Value(1)
 
-        # Convertir la colonne Date en datetime si ce n'est pas déjà fait
-        if "Date" in ventes.columns:
-            ventes["Date"] = pd.to_datetime(ventes["Date"], format="%d-%m-%Y")
-
-        # Fusionner les données de stock et de ventes pour afficher la quantité restante
-        ventes_data = ventes.merge(
-            stock[["Categorie", "Sous-categorie", "Produit", "Quantite"]],
-            on=["Categorie", "Sous-categorie", "Produit"],
-            how="left",
-            suffixes=("", "_stock")
-        )
-
-        # Renommer la colonne de quantité restante
-        ventes_data = ventes_data.rename(columns={"Quantite": "Quantite restante"})
+    @reactive.Calc
+    def ventes_filtrees():
+        # Filtres de catégorie, sous-catégorie et produit appliqués avant toute fusion ou mise en forme ;
+        # retourne (ventes, jetons) : le jeton de chaque vente est envoyé par l'action de suppression
+        ventes, jetons = ventes_et_jetons()
 
-        # Remplacer les NaN par 0 pour les produits sans stock
-        ventes_data["Quantite restante"] = ventes_data["Quantite restante"].fillna(0)
+        # Période : tranche de l'index des dates du magasin (recherche binaire), pas de masque sur tout l'historique
+        today = datetime.now().date()
+        date_debut = debut_periode(input.periode_vente(), today)
+        if date_debut is not None:
+            ventes, jetons = magasin.ventes_periode(date_debut, today)
 
-        # Appliquer les filtres seulement s'ils sont sélectionnés
-        filtered_data = ventes_data.copy()
+        masque = pd.Series(True, index=ventes.index)
 
         # Filtrage par catégorie
         if input.categorie_vente() and input.categorie_vente() != "Tous":
-            filtered_data = filtered_data[filtered_data["Categorie"] == input.categorie_vente()]
+            masque &= ventes["Categorie"] == input.categorie_vente()
 
         # Filtrage par sous-catégorie
         if input.sous_categorie_vente() and input.sous_categorie_vente() != "Tous":
-            filtered_data = filtered_data[filtered_data["Sous-categorie"] == input.sous_categorie_vente()]
+            masque &= ventes["Sous-categorie"] == input.sous_categorie_vente()
 
         # Filtrage par produit
         if input.produit_vente() and input.produit_vente() != "Tous":
-            filtered_data = filtered_data[filtered_data["Produit"] == input.produit_vente()]
+            masque &= ventes["Produit"] == input.produit_vente()
 
-        # Créer le tableau HTML avec une colonne "Action"
-        table_html = """
-        <div class="table-responsive">
-            <table class="table table-striped table-bordered">
-                <thead>
-                    <tr>
-                        <th>Catégorie</th>
-                        <th>Sous-catégorie</th>
-                        <th>Produit</th>
-                        <th>Prix unitaire</th>
-                        <th>Quantité vendue</th>
-                        <th>Total</th>
-                        <th>Quantité restante</th>
-                        <th>Date</th>
-                        <th>Action</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
+        return ventes[masque], jetons[masque.to_numpy()]
 
-        for i, row in filtered_data.iterrows():
-            table_html += f"""
-            <tr>
-                <td>{row['Categorie']}</td>
-                <td>{row['Sous-categorie']}</td>
-                <td>{row['Produit']}</td>
-                <td>{row['Prix unitaire']}</td>
-                <td>{row['Quantite vendue']}</td>
-                <td>{row['Total']:.2f} Fbu</td>
-                <td>{row['Quantite restante']}</td>
-                <td>{row['Date'].strftime('%d-%m-%Y')}</td>
-                <td>
-                    <span class="delete-icon" data-index="{i}" onclick="Shiny.setInputValue('delete_vente', {i}, {{priority: 'event'}});">🗑</span>
-                </td>
-            </tr>
-            """
-
-        table_html += """
-                </tbody>
-            </table>
-        </div>
-        """
+    @reactive.Effect
+    @reactive.event(input.categorie_vente, input.sous_categorie_vente, input.produit_vente, input.periode_vente, input.taille_page_vente)
+    def revenir_premiere_page_vente():
+        page_vente.set(1)
 
-        return ui.HTML(table_html)
-    
     @reactive.Effect
-    @reactive.event(input.categorie_vente)
-    def update_sous_categorie_vente():
-        stock = stock_data()
-        if not stock.empty and input.categorie_vente():
-            if input.categorie_vente() == "Tous":
-                sous_categories = ["Tous"] + stock["Sous-categorie"].unique().tolist()
-            else:
-                sous_categories = ["Tous"] + stock[stock["Categorie"] == input.categorie_vente()]["Sous-categorie"].unique().tolist()
-            ui.update_select("sous_categorie_vente", choices=sous_categories, selected="Tous")
+    @reactive.event(input.page_precedente_vente)
+    def page_precedente_vente():
+        page_vente.set(max(1, page_vente() - 1))
 
     @reactive.Effect
-    @reactive.event(input.sous_categorie_vente)
-    def update_produit_vente():
-        stock = stock_data()
-        if not stock.empty and input.categorie_vente() and input.sous_categorie_vente():
-            if input.categorie_vente() == "Tous" and input.sous_categorie_vente() == "Tous":
-                produits = ["Tous"] + stock["Produit"].unique().tolist()
-            elif input.categorie_vente() == "Tous":
-                produits = ["Tous"] + stock[stock["Sous-categorie"] == input.sous_categorie_vente()]["Produit"].unique().tolist()
-            elif input.sous_categorie_vente() == "Tous":
-                produits = ["Tous"] + stock[stock["Categorie"] == input.categorie_vente()]["Produit"].unique().tolist()
-            else:
-                produits = ["Tous"] + stock[
-                    (stock["Categorie"] == input.categorie_vente()) &
-                    (stock["Sous-categorie"] == input.sous_categorie_vente())
-                ]["Produit"].unique().tolist()
-            ui.update_select("produit_vente", choices=produits, selected="Tous")
+    @reactive.event(input.page_suivante_vente)
+    def page_suivante_vente():
+        _, _, page, _ = paginer(len(ventes_filtrees()[0]), page_vente() + 1, lire_taille_page(input.taille_page_vente()))
+        page_vente.set(page)
+
+    @output
+    @render.text
+    def pagination_vente():
+        nb_lignes = len(ventes_filtrees()[0])
+        _, _, page, nb_pages = paginer(nb_lignes, page_vente(), lire_taille_page(input.taille_page_vente()))
+        return f"Page {page} / {nb_pages} ({nb_lignes} ventes)"
+
+    # Affichage du tableau des ventes avec quantité restante au stock
+    @output
+    @render.ui
+    def tableau_vente():
+        ventes = vente_data()
+
+        # Si le tableau est vide, afficher un message
+        if ventes.empty:
+            return ui.p("Aucune vente enregistrée pour le moment.")
+
+        # Ne garder que la page visible des ventes filtrées
+        filtered_data, jetons = ventes_filtrees()
+        debut, fin, _, _ = paginer(len(filtered_data), page_vente(), lire_taille_page(input.taille_page_vente()))
+        filtered_data = filtered_data.iloc[debut:fin].copy()
+        jetons = jetons[debut:fin]
+
+        # Quantité restante au stock, cherchée dans l'index des produits pour les seules lignes affichées
+        # (0 pour les produits qui ne sont plus en stock), positions et quantités de la même version
+        filtered_data["Quantite restante"] = magasin.quantites_restantes(filtered_data)
+
+        # Créer le tableau HTML avec une colonne "Action"
+        table_html = tableaux.tableau_html(
+            ["Catégorie", "Sous-catégorie", "Produit", "Prix unitaire", "Quantité vendue", "Total",
+             "Quantité restante", "Date", "Action"],
+            [
+                tableaux.texte(filtered_data["Categorie"]),
+                tableaux.texte(filtered_data["Sous-categorie"]),
+                tableaux.texte(filtered_data["Produit"]),
+                tableaux.nombre(filtered_data["Prix unitaire"]),
+                tableaux.nombre(filtered_data["Quantite vendue"]),
+                tableaux.montant(filtered_data["Total"]),
+                tableaux.nombre(filtered_data["Quantite restante"]),
+                tableaux.date(filtered_data["Date"]),
+                tableaux.action(jetons, "delete_vente", "🗑", "delete-icon"),
+            ],
+        )
+
+        return ui.HTML(table_html)
     
     @reactive.Effect
     @reactive.event(input.delete_vente)
     def supprimer_vente():
-        index = input.delete_vente()
-        ventes = vente_data()
+        jeton = input.delete_vente()
         
-        if 0 <= index < len(ventes):
-            # Récupérer la vente à supprimer
-            vente_supprimee = ventes.iloc[index]
-            
-            # Supprimer la vente du DataFrame
-            ventes = ventes.drop(index).reset_index(drop=True)
-            
-            # Mettre à jour les données de ventes
-            vente_data.set(ventes)
+        # Récupérer la vente à supprimer parmi les ventes affichées
+        ventes, jetons = ventes_filtrees()
+        position = position_jeton(jetons, jeton)
+        
+        # Supprimer la vente partagée seulement si elle existe toujours (jeton)
+        version = magasin.supprimer_vente(jeton) if position is not None else None
+        version_courante.set(version if version is not None else magasin.version)
+        if version is None:
+            message_vente.set(MESSAGE_CONFLIT)
+            return
+        
+        # Afficher un message de confirmation
+        message_vente.set(f"Vente de {ventes['Produit'].iat[position]} supprimée avec succès.")
+
+    # Indicateur des opérations pas encore écrites sur disque (mode écriture différée)
+    @output
+    @render.ui
+    def modifications_en_attente():
+        if not ECRITURE_DIFFEREE:
+            return None
+        reactive.invalidate_later(INTERVALLE_SYNCHRONISATION)
+        version_courante()
+        nombre = stockage.modifications_en_attente()
+        if not nombre:
+            return None
+        return ui.span({"class": "badge bg-warning text-dark"}, f"{nombre} modification(s) non enregistrée(s)")
+
+    # Panier : les lignes s'accumulent dans la session, "Valider" les enregistre toutes ou aucune
+    @reactive.Effect
+    @reactive.event(input.ajouter_panier)
+    def ajouter_au_panier():
+        if not sans_tous(input.categorie_vente()) or not sans_tous(input.produit_vente()):
+            message_vente.set("Veuillez sélectionner une catégorie et un produit.")
+            return
+        if not input.quantite_vendue() or input.quantite_vendue() <= 0:
+            message_vente.set("La quantité vendue doit être positive.")
+            return
+        
+        ligne = {
+            "Categorie": input.categorie_vente(),
+            "Sous-categorie": sans_tous(input.sous_categorie_vente()) or "",
+            "Produit": input.produit_vente(),
+            # 0 : prix du stock au moment de la validation
+            "Prix unitaire": float(input.prix_unitaire_vente() or 0),
+            "Quantite vendue": float(input.quantite_vendue()),
+        }
+        lignes_panier.set(lignes_panier() + [ligne])
+        message_vente.set(f"{input.quantite_vendue()} {input.produit_vente()} ajoutés au panier.")
+
+    @reactive.Effect
+    @reactive.event(input.retirer_panier)
+    def retirer_du_panier():
+        index = input.retirer_panier()
+        lignes = list(lignes_panier())
+        if 0 <= index < len(lignes):
+            del lignes[index]
+            lignes_panier.set(lignes)
+
+    @reactive.Effect
+    @reactive.event(input.vider_panier)
+    def vider_panier():
+        lignes_panier.set([])
+
+    @reactive.Effect
+    @reactive.event(input.valider_panier)
+    def valider_panier():
+        lignes = lignes_panier()
+        if not lignes:
+            message_vente.set("Le panier est vide.")
+            return
+        
+        # Même validation vectorisée qu'un import : un seul décrément du stock, un seul ajout aux ventes,
+        # sur la dernière version du stock partagé
+        def valider(stock, ventes):
+            stock, ventes, operation, rejets = importation.importer_ventes(
+                stock, ventes, pd.DataFrame(lignes), pd.Timestamp(datetime.now().date())
+            )
+            # Tout ou rien : aucune ligne n'est enregistrée si une seule est refusée
+            return stock, ventes, operation if rejets.empty else None, rejets
+        
+        resultat = publier_sur_derniere_version(valider)
+        if resultat is None:
+            message_vente.set(MESSAGE_CONFLIT)
+            return
+        _, _, operation, rejets = resultat
+        if operation is None:
+            details = "; ".join(f"{produit} ({motif})" for produit, motif in zip(rejets["Produit"], rejets["Motif"]))
+            message_vente.set(f"Panier non validé, aucune vente enregistrée : {details}")
+            return
+        
+        total = sum(ligne["Total"] for ligne in operation[1]["lignes"])
+        lignes_panier.set([])
+        message_vente.set(f"Panier validé : {len(lignes)} lignes, {total:.2f} Fbu.")
+
+    @output
+    @render.ui
+    def panier():
+        lignes = lignes_panier()
+        if not lignes:
+            return ui.p("Le panier est vide.")
+        
+        contenu = pd.DataFrame(lignes)
+        prix = contenu["Prix unitaire"].where(contenu["Prix unitaire"] > 0)
+        return ui.HTML(tableaux.tableau_html(
+            ["Produit", "Quantité", "Prix unitaire", "Action"],
+            [
+                tableaux.texte(contenu["Produit"]),
+                tableaux.nombre(contenu["Quantite vendue"]),
+                np.where(prix.notna(), tableaux.montant(prix.fillna(0)), "Prix du stock"),
+                tableaux.action(contenu.index, "retirer_panier", "🗑", "delete-icon"),
+            ],
+        ))
+
+    # Réception d'une livraison fournisseur : fusion vectorisée dans le stock, une seule publication
+    @reactive.Effect
+    @reactive.event(input.fichier_stock)
+    def importer_fichier_stock():
+        fichiers = input.fichier_stock()
+        if not fichiers:
+            return
+        fichier = fichiers[0]
+        try:
+            lignes = importation.lire_fichier(fichier["datapath"], fichier["name"])
             
-            # Sauvegarder les données
-            save_data(stock_data(), ventes)
+            def receptionner(stock, ventes):
+                stock, operation, rejets = importation.receptionner_stock(stock, lignes, pd.Timestamp(datetime.now().date()))
+                return stock, None, operation, rejets
             
-            # Afficher un message de confirmation
-            message_vente.set(f"Vente de {vente_supprimee['Produit']} supprimée avec succès.")
+            resultat = publier_sur_derniere_version(receptionner)
+        except ValueError as erreur:
+            rapport_stock.set(ui.div({"class": "alert alert-danger"}, f"Import impossible : {erreur}"))
+            return
+        if resultat is None:
+            rapport_stock.set(ui.div({"class": "alert alert-warning"}, MESSAGE_CONFLIT))
+            return
+        
+        _, _, operation, rejets = resultat
+        if operation is not None:
+            resume = (
+                f"Livraison {fichier['name']} intégrée : {len(operation[1]['lignes'])} produits créés, "
+                f"{len(operation[1]['quantites'])} produits mis à jour."
+            )
+        else:
+            resume = f"Aucune ligne de {fichier['name']} n'a été intégrée."
+        rapport_stock.set(rapport_import(resume, rejets))
+
+    @output
+    @render.ui
+    def rapport_import_stock():
+        return rapport_stock()
+
+    # Import en masse des ventes (export de caisse) : validation vectorisée, une seule publication
+    @reactive.Effect
+    @reactive.event(input.fichier_ventes)
+    def importer_fichier_ventes():
+        fichiers = input.fichier_ventes()
+        if not fichiers:
+            return
+        fichier = fichiers[0]
+        try:
+            lignes = importation.lire_fichier(fichier["datapath"], fichier["name"])
+            resultat = publier_sur_derniere_version(
+                lambda stock, ventes: importation.importer_ventes(stock, ventes, lignes, pd.Timestamp(datetime.now().date()))
+            )
+        except ValueError as erreur:
+            rapport_ventes.set(ui.div({"class": "alert alert-danger"}, f"Import impossible : {erreur}"))
+            return
+        if resultat is None:
+            rapport_ventes.set(ui.div({"class": "alert alert-warning"}, MESSAGE_CONFLIT))
+            return
+        
+        _, _, operation, rejets = resultat
+        nb_importees = len(operation[1]["lignes"]) if operation is not None else 0
+        rapport_ventes.set(rapport_import(f"{nb_importees} ventes importées depuis {fichier['name']}.", rejets))
+
+    @output
+    @render.ui
+    def rapport_import_ventes():
+        return rapport_ventes()
 
     # Fusionner les données de stock et de ventes pour l'analyse
     @reactive.Calc
@@ -1094,36 +1361,25 @@ def server(input, output, session):
     # Initialisation des choix au démarrage
     @reactive.Calc
     def filtered_data():
-        stock = stock_data()
-        ventes = vente_data()
-        
-        # Convertir les dates en pandas.Timestamp pour uniformiser le format
-        if not ventes.empty and "Date" in ventes.columns:
-            if not pd.api.types.is_datetime64_any_dtype(ventes["Date"]):
-                ventes["Date"] = pd.to_datetime(ventes["Date"], format="%d-%m-%Y", errors='coerce')
-        
-        if not stock.empty and "Date" in stock.columns:
-            if not pd.api.types.is_datetime64_any_dtype(stock["Date"]):
-                stock["Date"] = pd.to_datetime(stock["Date"], format="%d-%m-%Y", errors='coerce')
+        # Stock avec quantités initiales et pourcentages restants déjà calculés
+        stock = calculer_pourcentage_stock()
         
         # Filtrer par dates si des dates sont sélectionnées
         date_debut = pd.to_datetime(input.date_debut()) if input.date_debut() else None
         date_fin = pd.to_datetime(input.date_fin()) if input.date_fin() else None
         
-        # Filtrer les ventes par date
-        filtered_ventes = ventes.copy()
-        if date_debut is not None:
-            filtered_ventes = filtered_ventes[filtered_ventes["Date"] >= date_debut]
-        if date_fin is not None:
-            filtered_ventes = filtered_ventes[filtered_ventes["Date"] <= date_fin]
+        # Filtres de catégorie, sous-catégorie et produit ("Tous" = aucun filtre)
+        categorie = input.categorie_analyse() if input.categorie_analyse() not in (None, "", "Tous") else None
+        sous_categorie = input.sous_categorie_analyse() if input.sous_categorie_analyse() not in (None, "", "Tous") else None
+        produit = input.produit_analyse() if input.produit_analyse() not in (None, "", "Tous") else None
+        
+        # Ventes par produit lues dans le cube journalier du magasin (pas de parcours des ventes)
+        ventes_par_produit = magasin.ventes_par_produit(date_debut, date_fin, categorie, sous_categorie, produit)
         
         # Fusionner les données de stock et de ventes filtrées
-        if not filtered_ventes.empty:
+        if not ventes_par_produit.empty:
             merged = stock.merge(
-                filtered_ventes.groupby(["Categorie", "Sous-categorie", "Produit"]).agg({
-                    "Quantite vendue": "sum",
-                    "Total": "sum"
-                }).reset_index(),
+                ventes_par_produit,
                 on=["Categorie", "Sous-categorie", "Produit"],
                 how="left"
             )
@@ -1134,12 +1390,12 @@ def server(input, output, session):
             merged["Total"] = 0
         
         # Appliquer les filtres de catégorie, sous-catégorie et produit
-        if input.categorie_analyse() and input.categorie_analyse() != "Tous":
-            merged = merged[merged["Categorie"] == input.categorie_analyse()]
-        if input.sous_categorie_analyse() and input.sous_categorie_analyse() != "Tous":
-            merged = merged[merged["Sous-categorie"] == input.sous_categorie_analyse()]
-        if input.produit_analyse() and input.produit_analyse() != "Tous":
-            merged = merged[merged["Produit"] == input.produit_analyse()]
+        if categorie is not None:
+            merged = merged[merged["Categorie"] == categorie]
+        if sous_categorie is not None:
+            merged = merged[merged["Sous-categorie"] == sous_categorie]
+        if produit is not None:
+            merged = merged[merged["Produit"] == produit]
         
         return merged
         
@@ -1179,107 +1435,55 @@ def server(input, output, session):
     @output
     @render.text
     def total_stock():
-        stock = stock_data()
-        # Calcul de la valeur totale du stock actuel
-        valeur_stock_actuel = (stock["Prix unitaire"] * stock["Quantite"]).sum()
-    
-        # Calculer la valeur de tous les produits (stock actuel + vendus)
-        ventes = vente_data()
-        valeur_produits_vendus = 0
-        if not ventes.empty:
-            valeur_produits_vendus = ventes["Total"].sum()
-    
-        valeur_totale = valeur_stock_actuel + valeur_produits_vendus
+        # Totaux tenus à jour par le magasin à chaque opération : aucun parcours des tables
+        version_courante()
+        totaux = magasin.totaux
+        valeur_totale = totaux.valeur_stock + totaux.montant_ventes
         return f"Valeur totale des produits (stock + vendus) : {valeur_totale:.2f} Fbu"
 
     @output
     @render.text
     def total_ventes():
-        ventes = vente_data()
-        if ventes.empty:
-            return "Coût total des produits vendus : 0.00 Fbu"
-    
-        cout_total_ventes = ventes["Total"].sum()
-        return f"Coût total des produits vendus : {cout_total_ventes:.2f} Fbu"
+        version_courante()
+        totaux = magasin.totaux
+        return (
+            f"Coût total des produits vendus : {totaux.montant_ventes:.2f} Fbu"
+            f" ({totaux.unites_vendues:g} unités)"
+        )
 
     # Fonction pour calculer les pourcentages de stock restant
+    # Pourcentages de stock restant : un seul calcul par version du magasin, partagé par
+    # toutes les sessions pour le tableau d'analyse (copie, le stock publié n'est pas modifié)
+    @reactive.Calc
     def calculer_pourcentage_stock():
-        stock = stock_data()
-        
-        if stock.empty:
-            return pd.DataFrame()
-            
-        # S'assurer que la colonne Quantite_initiale existe
-        if "Quantite_initiale" not in stock.columns:
-            stock["Quantite_initiale"] = stock["Quantite"]
-            for i, row in stock.iterrows():
-                # Chercher si ce produit a été vendu
-                ventes = vente_data()
-                if not ventes.empty:
-                    ventes_produit = ventes[
-                        (ventes["Categorie"] == row["Categorie"]) & 
-                        (ventes["Produit"] == row["Produit"])
-                    ]
-                    if not ventes_produit.empty:
-                        # Estimer la quantité initiale en ajoutant les ventes
-                        stock.loc[i, "Quantite_initiale"] = row["Quantite"] + ventes_produit["Quantite vendue"].sum()
-    
-        # Calculer le pourcentage restant
-        stock["Pourcentage_restant"] = (stock["Quantite"] / stock["Quantite_initiale"] * 100).round(2)
-        
-        # Remplacer NaN par 0
-        stock = stock.fillna(0)
-        
-        return stock
+        stock_data()
+        return magasin.pourcentages_stock()
     
     # Alertes de stock critique (20% ou moins)
     @output
     @render.ui
     def alerte_stock_critique():
-        stock = calculer_pourcentage_stock()
-        stock_critique = stock[stock["Pourcentage_restant"] <= 20]
+        # Ensemble tenu à jour par le moteur d'alertes du magasin (pas de parcours du stock)
+        stock_data()
+        stock_critique = magasin.alertes_stock(CRITIQUE)
         
         if stock_critique.empty:
             return ui.p("Aucun produit n'est actuellement à un niveau critique.")
         
         # Créer le tableau HTML
-        table_html = """
-        <div class="table-responsive">
-            <table class="table table-striped table-bordered">
-                <thead>
-                    <tr>
-                        <th>Catégorie</th>
-                        <th>Sous-catégorie</th>
-                        <th>Produit</th>
-                        <th>Stock initial</th>
-                        <th>Stock restant</th>
-                        <th>Pourcentage</th>
-                        <th>Action</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        for i, row in stock_critique.iterrows():
-            table_html += f"""
-            <tr class="alert-low-stock">
-                <td>{row['Categorie']}</td>
-                <td>{row['Sous-categorie']}</td>
-                <td>{row['Produit']}</td>
-                <td>{row['Quantite_initiale']}</td>
-                <td>{row['Quantite']}</td>
-                <td><span class="stock-percentage">{row['Pourcentage_restant']}%</span></td>
-                <td>
-                    <button onclick="Shiny.setInputValue('commander', {i}, {{priority: 'event'}});">Commander</button>
-                </td>
-            </tr>
-            """
-        
-        table_html += """
-                </tbody>
-            </table>
-        </div>
-        """
+        table_html = tableaux.tableau_html(
+            ["Catégorie", "Sous-catégorie", "Produit", "Stock initial", "Stock restant", "Pourcentage", "Action"],
+            [
+                tableaux.texte(stock_critique["Categorie"]),
+                tableaux.texte(stock_critique["Sous-categorie"]),
+                tableaux.texte(stock_critique["Produit"]),
+                tableaux.nombre(stock_critique["Quantite_initiale"]),
+                tableaux.nombre(stock_critique["Quantite"]),
+                tableaux.pourcentage(stock_critique["Pourcentage_restant"]),
+                tableaux.action(stock_critique.index, "commander", "Commander", None, balise="button"),
+            ],
+            classe_ligne="alert-low-stock",
+        )
         
         return ui.HTML(table_html)
     
@@ -1287,46 +1491,24 @@ def server(input, output, session):
     @output
     @render.ui
     def alerte_stock_faible():
-        stock = calculer_pourcentage_stock()
-        stock_faible = stock[(stock["Pourcentage_restant"] > 20) & (stock["Pourcentage_restant"] <= 40)]
+        stock_data()
+        stock_faible = magasin.alertes_stock(FAIBLE)
         
         if stock_faible.empty:
             return ui.p("Aucun produit n'est actuellement à un niveau de stock faible.")
         
         # Créer le tableau HTML
-        table_html = """
-        <div class="table-responsive">
-            <table class="table table-striped table-bordered">
-                <thead>
-                    <tr>
-                        <th>Catégorie</th>
-                        <th>Sous-catégorie</th>
-                        <th>Produit</th>
-                        <th>Stock initial</th>
-                        <th>Stock restant</th>
-                        <th>Pourcentage</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        for i, row in stock_faible.iterrows():
-            table_html += f"""
-            <tr>
-                <td>{row['Categorie']}</td>
-                <td>{row['Sous-categorie']}</td>
-                <td>{row['Produit']}</td>
-                <td>{row['Quantite_initiale']}</td>
-                <td>{row['Quantite']}</td>
-                <td><span class="stock-percentage">{row['Pourcentage_restant']}%</span></td>
-            </tr>
-            """
-        
-        table_html += """
-                </tbody>
-            </table>
-        </div>
-        """
+        table_html = tableaux.tableau_html(
+            ["Catégorie", "Sous-catégorie", "Produit", "Stock initial", "Stock restant", "Pourcentage"],
+            [
+                tableaux.texte(stock_faible["Categorie"]),
+                tableaux.texte(stock_faible["Sous-categorie"]),
+                tableaux.texte(stock_faible["Produit"]),
+                tableaux.nombre(stock_faible["Quantite_initiale"]),
+                tableaux.nombre(stock_faible["Quantite"]),
+                tableaux.pourcentage(stock_faible["Pourcentage_restant"]),
+            ],
+        )
         
         return ui.HTML(table_html)
     
@@ -1355,46 +1537,19 @@ def server(input, output, session):
                 produit_top = produits_vendus.sort_values("Quantite vendue", ascending=False).iloc[0]
                 produit_top_info = f"{produit_top['Produit']} ({produit_top['Quantite vendue']} unités)"
         
-        # Ventes par catégorie (avec gestion des dates)
-        ventes = vente_data()
-        
-        # Filtrer les ventes par date
+        # Ventes par catégorie et date, lues dans le cube journalier (déjà triées par date)
         date_debut = pd.to_datetime(input.date_debut()) if input.date_debut() else None
         date_fin = pd.to_datetime(input.date_fin()) if input.date_fin() else None
+        ventes_par_categorie = magasin.ventes_par_categorie_et_jour(date_debut, date_fin)
         
-        if not ventes.empty and "Date" in ventes.columns:
-            # Assurez-vous que les dates sont au bon format
-            if not pd.api.types.is_datetime64_any_dtype(ventes["Date"]):
-                ventes["Date"] = pd.to_datetime(ventes["Date"], format="%d-%m-%Y", errors='coerce')
-            
-            # Appliquer les filtres de date
-            if date_debut is not None:
-                ventes = ventes[ventes["Date"] >= date_debut]
-            if date_fin is not None:
-                ventes = ventes[ventes["Date"] <= date_fin]
-        
-        # Ventes par catégorie et date
-        if not ventes.empty:
-            ventes_par_categorie = ventes.groupby(["Categorie", "Date"]).agg({
-                "Total": "sum",
-                "Quantite vendue": "sum"
-            }).reset_index()
-            
-            # Trier par date
-            ventes_par_categorie = ventes_par_categorie.sort_values("Date")
-            
+        if not ventes_par_categorie.empty:
             # Créer le contenu du tableau ventes par catégorie
-            rows_categorie = ""
-            for _, row in ventes_par_categorie.iterrows():
-                date_str = row['Date'].strftime('%d-%m-%Y')  # Format "dd-mm-yyyy"
-                rows_categorie += f"""
-                <tr>
-                    <td>{row['Categorie']}</td>
-                    <td>{date_str}</td>
-                    <td>{row['Quantite vendue']}</td>
-                    <td>{row['Total']:.2f} Fbu</td>
-                </tr>
-                """
+            rows_categorie = tableaux.lignes_html([
+                tableaux.texte(ventes_par_categorie["Categorie"]),
+                tableaux.date(ventes_par_categorie["Date"]),  # Format "dd-mm-yyyy"
+                tableaux.nombre(ventes_par_categorie["Quantite vendue"]),
+                tableaux.montant(ventes_par_categorie["Total"]),
+            ])
         else:
             rows_categorie = "<tr><td colspan='4'>Pas de ventes pour la période sélectionnée</td></tr>"
         
@@ -1460,52 +1615,25 @@ def server(input, output, session):
         # Remplacer NaN par 0
         filtered = filtered.fillna(0)
         
-        # Calculer le pourcentage de stock restant
-        if "Quantite_initiale" in filtered.columns and "Quantite" in filtered.columns:
-            filtered["Pourcentage_restant"] = (filtered["Quantite"] / filtered["Quantite_initiale"] * 100).round(2)
-        else:
-            return ui.p("Données de stock incomplètes.")
+        # Colonnes de ventes absentes : 0 pour tous les produits
+        quantite_vendue = filtered["Quantite vendue"] if "Quantite vendue" in filtered.columns else pd.Series(0, index=filtered.index)
+        total_ventes = filtered["Total"] if "Total" in filtered.columns else pd.Series(0, index=filtered.index)
         
         # Créer le tableau HTML
-        table_html = """
-        <div class="table-responsive">
-            <table class="table table-striped table-bordered">
-                <thead>
-                    <tr>
-                        <th>Catégorie</th>
-                        <th>Sous-catégorie</th>
-                        <th>Produit</th>
-                        <th>Stock initial</th>
-                        <th>Stock restant</th>
-                        <th>Pourcentage restant</th>
-                        <th>Quantité vendue</th>
-                        <th>Total ventes</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        for _, row in filtered.iterrows():
-            quantite_vendue = row.get('Quantite vendue', 0)
-            total_ventes = row.get('Total', 0)
-            table_html += f"""
-            <tr>
-                <td>{row['Categorie']}</td>
-                <td>{row['Sous-categorie']}</td>
-                <td>{row['Produit']}</td>
-                <td>{row['Quantite_initiale']}</td>
-                <td>{row['Quantite']}</td>
-                <td><span class="stock-percentage">{row['Pourcentage_restant']}%</span></td>
-                <td>{quantite_vendue}</td>
-                <td>{total_ventes:.2f} Fbu</td>
-            </tr>
-            """
-        
-        table_html += """
-                </tbody>
-            </table>
-        </div>
-        """
+        table_html = tableaux.tableau_html(
+            ["Catégorie", "Sous-catégorie", "Produit", "Stock initial", "Stock restant", "Pourcentage restant",
+             "Quantité vendue", "Total ventes"],
+            [
+                tableaux.texte(filtered["Categorie"]),
+                tableaux.texte(filtered["Sous-categorie"]),
+                tableaux.texte(filtered["Produit"]),
+                tableaux.nombre(filtered["Quantite_initiale"]),
+                tableaux.nombre(filtered["Quantite"]),
+                tableaux.pourcentage(filtered["Pourcentage_restant"]),
+                tableaux.nombre(quantite_vendue),
+                tableaux.montant(total_ventes),
+            ],
+        )
         
         return ui.HTML(table_html)
     
@@ -1523,46 +1651,36 @@ def server(input, output, session):
         filtered_data.set(stock_data())
 
     # Mise à jour des fonctions pour les actions sur les dates
+    # (les bornes sont lues dans le cube journalier du magasin par recherche binaire)
+    def appliquer_periode(periode):
+        today = datetime.now().date()
+        ui.update_date("date_debut", value=debut_periode(periode, today))
+        ui.update_date("date_fin", value=today)
+
     @reactive.Effect
     @reactive.event(input.aujourd_hui)
     def set_aujourd_hui():
-        today = datetime.now().date()
-        ui.update_date("date_debut", value=today)
-        ui.update_date("date_fin", value=today)
+        appliquer_periode("aujourd_hui")
 
     @reactive.Effect
     @reactive.event(input.cette_semaine)
     def set_cette_semaine():
-        today = datetime.now().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        ui.update_date("date_debut", value=start_of_week)
-        ui.update_date("date_fin", value=today)
+        appliquer_periode("cette_semaine")
 
     @reactive.Effect
     @reactive.event(input.ce_mois)
     def set_ce_mois():
-        today = datetime.now().date()
-        start_of_month = today.replace(day=1)
-        ui.update_date("date_debut", value=start_of_month)
-        ui.update_date("date_fin", value=today)
+        appliquer_periode("ce_mois")
 
     @reactive.Effect
     @reactive.event(input.ce_trimestre)
     def set_ce_trimestre():
-        today = datetime.now().date()
-        current_quarter = ((today.month - 1) // 3) + 1
-        start_month = (current_quarter - 1) * 3 + 1
-        start_of_quarter = today.replace(month=start_month, day=1)
-        ui.update_date("date_debut", value=start_of_quarter)
-        ui.update_date("date_fin", value=today)
+        appliquer_periode("ce_trimestre")
 
     @reactive.Effect
     @reactive.event(input.cette_annee)
     def set_cette_annee():
-        today = datetime.now().date()
-        start_of_year = today.replace(month=1, day=1)
-        ui.update_date("date_debut", value=start_of_year)
-        ui.update_date("date_fin", value=today)
+        appliquer_periode("cette_annee")
 
     @reactive.Effect
     @reactive.event(input.tout)
@@ -1571,4 +1689,9 @@ def server(input, output, session):
         ui.update_date("date_fin", value=None)
 
 # Créer l'application Shiny
-app = App(app_ui, server)
\ No newline at end of file
+app = App(app_ui, server)
+
+# uvicorn relance le signal d'arrêt après sa fermeture, sans passer par atexit :
+# la file d'écriture différée est vidée à l'arrêt de l'application
+if ECRITURE_DIFFEREE:
+    app.on_shutdown(stockage.arreter)
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+Mesure le coût des opérations principales de l'application sur des données
+synthétiques (benchmarks/generateur.py) : chargement et sauvegarde par
+backend, vente et ajout de produit (persistance comprise), analyse
+(filtered_data), statistiques de vente et rendu des tableaux HTML.
+
+Chaque opération est chronométrée (meilleur temps sur plusieurs essais), puis
+rejouée une fois sous tracemalloc pour son pic de mémoire. Les fichiers de
+données sont écrits dans un dossier temporaire, supprimé à la fin.
+
+Usage : python benchmarks/bench_magasin.py [--tailles 1000x100000 ...]
+        [--backends csv journal sqlite] [--repetitions 3] [--json resultats.jsonl]
+
+Une taille s'écrit produitsxventes, par exemple 100000x10000000.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DOSSIER_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DOSSIER_BENCHMARKS))
+sys.path.insert(0, DOSSIER_BENCHMARKS)
+
+import stockage
+import tableaux
+from magasin import Magasin, pourcentages_stock, CRITIQUE
+from bench_tableaux import rendu_colonnes
+from generateur import generer_boutique
+
+# Période des analyses (les derniers jours de l'historique généré)
+JOURS_ANALYSE = 90
+
+# Lignes d'une page des tableaux paginés
+TAILLE_PAGE = 50
+
+
+def chronometrer(fonction, repetitions=3):
+    meilleur = float("inf")
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+def pic_memoire(fonction):
+    # Pic des allocations Python et numpy pendant un appel (en octets)
+    tracemalloc.start()
+    try:
+        fonction()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def vider_donnees():
+    shutil.rmtree(stockage.DATA_DIR, ignore_errors=True)
+    os.makedirs(stockage.DATA_DIR)
+
+
+# Opérations, reprises de app.py sans session Shiny
+
+def vendre(magasin, rng, aujourd_hui):
+    # enregistrer_vente : lecture de la ligne puis décrément compare-and-swap
+    position = int(rng.integers(len(magasin.stock)))
+    jeton, produit = magasin.lire_ligne(position)
+    magasin.vendre(position, jeton, pd.DataFrame({
+        "Categorie": [produit["Categorie"]],
+        "Sous-categorie": [produit["Sous-categorie"]],
+        "Produit": [produit["Produit"]],
+        "Prix unitaire": [float(produit["Prix unitaire"])],
+        "Quantite vendue": [1.0],
+        "Date": [aujourd_hui],
+        "Total": [float(produit["Prix unitaire"])],
+    }))
+
+def ajouter_produit(magasin, numero, aujourd_hui):
+    # ajouter_produit : nouvelle ligne de stock (clé cherchée dans l'index du magasin)
+    nouvelle_ligne = pd.DataFrame({
+        "Categorie": ["Categorie 00"],
+        "Sous-categorie": ["Sous-categorie 00-0"],
+        "Produit": [f"Nouveau produit {numero}"],
+        "Prix unitaire": [1000.0],
+        "Quantite": [10.0],
+        "Date": [aujourd_hui],
+        "Quantite_initiale": [10.0],
+    })
+    magasin.ajouter_produit(nouvelle_ligne)
+
+def analyser(magasin, date_debut, date_fin):
+    # filtered_data : pourcentages de stock fusionnés avec les ventes de la période
+    pourcentages = pourcentages_stock(magasin.stock, magasin.ventes)
+    ventes_par_produit = magasin.ventes_par_produit(date_debut, date_fin)
+    return pourcentages.merge(ventes_par_produit, on=stockage.COLONNES_PRODUIT, how="left")
+
+def statistiques(magasin, date_debut, date_fin):
+    # statistiques_vente : totaux, produit le plus vendu et tableau par catégorie et jour
+    filtre = analyser(magasin, date_debut, date_fin)
+    filtre["Total"].sum()
+    filtre.sort_values("Quantite vendue", ascending=False).head(1)
+    par_categorie = magasin.ventes_par_categorie_et_jour(date_debut, date_fin)
+    return tableaux.lignes_html([
+        tableaux.texte(par_categorie["Categorie"]),
+        tableaux.date(par_categorie["Date"]),
+        tableaux.nombre(par_categorie["Quantite vendue"]),
+        tableaux.montant(par_categorie["Total"]),
+    ])
+
+def rendu_ventes(magasin):
+    # tableau_vente : dernière page de l'historique avec la quantité restante en stock
+    ventes, jetons = magasin.lire_ventes()
+    page = ventes.iloc[-TAILLE_PAGE:]
+    restantes = pd.Series(magasin.quantites_restantes(page))
+    return tableaux.tableau_html(
+        ["Catégorie", "Sous-catégorie", "Produit", "Prix unitaire", "Quantité vendue", "Total",
+         "Quantité restante", "Date", "Action"],
+        [
+            tableaux.texte(page["Categorie"]),
+            tableaux.texte(page["Sous-categorie"]),
+            tableaux.texte(page["Produit"]),
+            tableaux.nombre(page["Prix unitaire"]),
+            tableaux.nombre(page["Quantite vendue"]),
+            tableaux.montant(page["Total"]),
+            tableaux.nombre(restantes),
+            tableaux.date(page["Date"]),
+            tableaux.action(jetons[-TAILLE_PAGE:], "delete_vente", "🗑", "delete-icon"),
+        ],
+    )
+
+def rendu_alertes(magasin):
+    # alerte_stock_critique : lignes tenues à jour par le moteur d'alertes
+    critiques = magasin.alertes_stock(CRITIQUE)
+    return tableaux.tableau_html(
+        ["Catégorie", "Sous-catégorie", "Produit", "Stock initial", "Stock restant", "Pourcentage"],
+        [
+            tableaux.texte(critiques["Categorie"]),
+            tableaux.texte(critiques["Sous-categorie"]),
+            tableaux.texte(critiques["Produit"]),
+            tableaux.nombre(critiques["Quantite_initiale"]),
+            tableaux.nombre(critiques["Quantite"]),
+            tableaux.pourcentage(critiques["Pourcentage_restant"]),
+        ],
+    )
+
+
+def mesurer(nb_produits, nb_ventes, backends, repetitions):
+    """
+    Mesure toutes les opérations pour une taille de boutique ; retourne une
+    liste de résultats (un dictionnaire par opération et backend).
+    """
+    resultats = []
+    taille = f"{nb_produits}x{nb_ventes}"
+
+    def noter(operation, fonction, backend="-", essais=repetitions):
+        duree = chronometrer(fonction, essais)
+        memoire = pic_memoire(fonction)
+        resultats.append({
+            "taille": taille, "produits": nb_produits, "ventes": nb_ventes,
+            "operation": operation, "backend": backend, "secondes": duree, "octets": memoire,
+        })
+        print(f"{taille:>18}  {operation:<22} {backend:<8} {duree * 1000:>11.2f}  {memoire / 2**20:>10.1f}", flush=True)
+
+    donnees = {}
+    noter("generation", lambda: donnees.update(zip(("stock", "ventes"), generer_boutique(nb_produits, nb_ventes))), essais=1)
+    stock, ventes = donnees["stock"], donnees["ventes"]
+    aujourd_hui = ventes["Date"].iat[-1] if len(ventes) else pd.Timestamp("2024-01-01")
+    date_debut = aujourd_hui - pd.Timedelta(days=JOURS_ANALYSE)
+
+    # Persistance : sauvegarde complète, chargement, puis mutations persistées par le backend
+    for backend in backends:
+        vider_donnees()
+        persistance = stockage.creer_stockage(backend)
+        noter("sauvegarde", lambda: persistance.sauvegarder(stock, ventes), backend)
+        noter("chargement", lambda: stockage.creer_stockage(backend).charger(), backend)
+
+        magasin = Magasin(persistance, stock, ventes)
+        rng = np.random.default_rng(0)
+        noter("vente", lambda: vendre(magasin, rng, aujourd_hui), backend)
+        compteur = iter(range(10**9))
+        noter("ajout_produit", lambda: ajouter_produit(magasin, next(compteur), aujourd_hui), backend)
+
+    # Calculs et rendus en mémoire (sans écriture)
+    noter("magasin", lambda: donnees.update(magasin=Magasin(stockage.Stockage(), stock, ventes)))
+    magasin = donnees["magasin"]
+    noter("analyse", lambda: analyser(magasin, date_debut, aujourd_hui))
+    noter("statistiques_vente", lambda: statistiques(magasin, date_debut, aujourd_hui))
+    noter("tableau_stock_page", lambda: rendu_colonnes(stock.iloc[:TAILLE_PAGE]))
+    noter("tableau_stock_tout", lambda: rendu_colonnes(stock))
+    noter("tableau_vente_page", lambda: rendu_ventes(magasin))
+    noter("alertes", lambda: rendu_alertes(magasin))
+    return resultats
+
+
+def lire_taille(texte):
+    try:
+        nb_produits, nb_ventes = (int(valeur) for valeur in texte.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"taille invalide : {texte} (attendu : produitsxventes)")
+    return nb_produits, nb_ventes
+
+
+def main(arguments=None):
+    parseur = argparse.ArgumentParser(description="Benchmarks des opérations de gestion de stock.")
+    parseur.add_argument("--tailles", nargs="+", type=lire_taille, default=[(1_000, 10_000), (10_000, 100_000)],
+                         help="tailles produitsxventes (défaut : 1000x10000 10000x100000)")
+    parseur.add_argument("--backends", nargs="+", choices=["csv", "journal", "sqlite"], default=["csv", "journal", "sqlite"])
+    parseur.add_argument("--repetitions", type=int, default=3)
+    parseur.add_argument("--json", help="ajoute les résultats à ce fichier (une ligne JSON par mesure)")
+    options = parseur.parse_args(arguments)
+
+    # Chemin du fichier de résultats relatif au dossier de lancement, pas au dossier temporaire
+    fichier_json = os.path.abspath(options.json) if options.json else None
+    contexte = {
+        "horodatage": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+
+    print(f"{'taille':>18}  {'operation':<22} {'backend':<8} {'temps (ms)':>11}  {'pic (Mo)':>10}")
+    # stockage lit et écrit dans "data/" relatif au dossier courant : dossier temporaire
+    dossier_lancement = os.getcwd()
+    dossier_temporaire = tempfile.mkdtemp(prefix="bench_magasin_")
+    try:
+        os.chdir(dossier_temporaire)
+        for nb_produits, nb_ventes in options.tailles:
+            resultats = mesurer(nb_produits, nb_ventes, options.backends, options.repetitions)
+            if fichier_json:
+                with open(fichier_json, "a", encoding="utf-8") as f:
+                    for resultat in resultats:
+                        f.write(json.dumps({**contexte, **resultat}, ensure_ascii=False) + "\n")
+    finally:
+        os.chdir(dossier_lancement)
+        shutil.rmtree(dossier_temporaire, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare le rendu HTML ligne par ligne (iterrows + f-string, ancienne méthode)
+au rendu par colonnes de tableaux.tableau_html().
+
+Usage : python benchmarks/bench_tableaux.py [nb_lignes ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tableaux
+
+
+def generer_stock(nb_lignes, graine=0):
+    rng = np.random.default_rng(graine)
+    return pd.DataFrame({
+        "Categorie": [f"Categorie {i}" for i in rng.integers(0, 50, nb_lignes)],
+        "Sous-categorie": [f"Sous-categorie {i}" for i in rng.integers(0, 500, nb_lignes)],
+        "Produit": [f"Produit {i}" for i in range(nb_lignes)],
+        "Prix unitaire": rng.integers(100, 100000, nb_lignes).astype(float),
+        "Quantite": rng.integers(0, 1000, nb_lignes).astype(float),
+        "Date": "01-01-2025",
+    })
+
+
+def rendu_iterrows(stock):
+    lignes = []
+    for i, row in stock.iterrows():
+        lignes.append(f"""
+            <tr>
+                <td>{row['Categorie']}</td>
+                <td>{row['Sous-categorie']}</td>
+                <td>{row['Produit']}</td>
+                <td>{row['Prix unitaire']}</td>
+                <td>{row['Quantite']}</td>
+                <td>{row['Date']}</td>
+                <td>
+                    <span class="delete-icon" data-index="{i}" onclick="Shiny.setInputValue('delete', {i}, {{priority: 'event'}});">🗑</span>
+                    <span class="edit-icon" data-index="{i}" onclick="Shiny.setInputValue('modifier', {i}, {{priority: 'event'}});">✏</span>
+                </td>
+            </tr>
+            """)
+    return '<table class="table"><tbody>' + "".join(lignes) + "</tbody></table>"
+
+
+def rendu_colonnes(stock):
+    actions = (
+        tableaux.action(stock.index, "delete", "🗑", "delete-icon")
+        + " "
+        + tableaux.action(stock.index, "modifier", "✏", "edit-icon")
+    )
+    return tableaux.tableau_html(
+        ["Catégorie", "Sous-catégorie", "Produit", "Prix unitaire", "Quantité", "Date", "Action"],
+        [
+            tableaux.texte(stock["Categorie"]),
+            tableaux.texte(stock["Sous-categorie"]),
+            tableaux.texte(stock["Produit"]),
+            tableaux.nombre(stock["Prix unitaire"]),
+            tableaux.nombre(stock["Quantite"]),
+            tableaux.date(stock["Date"]),
+            actions,
+        ],
+        classe="table",
+        responsive=False,
+    )
+
+
+def chronometrer(fonction, *args, repetitions=3):
+    meilleur = float("inf")
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(*args)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+
+def main(tailles):
+    print(f"{'lignes':>8}  {'iterrows (s)':>12}  {'colonnes (s)':>12}  {'gain':>6}")
+    for nb_lignes in tailles:
+        stock = generer_stock(nb_lignes)
+        t_iterrows = chronometrer(rendu_iterrows, stock)
+        t_colonnes = chronometrer(rendu_colonnes, stock)
+        print(f"{nb_lignes:>8}  {t_iterrows:>12.3f}  {t_colonnes:>12.3f}  {t_iterrows / t_colonnes:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000])
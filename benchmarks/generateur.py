@@ -0,0 +1,96 @@
+"""
+Générateur déterministe de données de boutique pour les benchmarks : un
+catalogue hiérarchique (catégories, sous-catégories, produits) et un
+historique de ventes chronologique, aux types utilisés en mémoire par
+l'application (catégories pandas partagées, dates en datetime64).
+
+Même graine, mêmes tailles : mêmes données, d'une exécution à l'autre.
+"""
+import numpy as np
+import pandas as pd
+
+# Nombre de sous-catégories par catégorie
+SOUS_CATEGORIES_PAR_CATEGORIE = 10
+
+# Exposant de la loi de popularité des produits (quelques produits font l'essentiel des ventes)
+EXPOSANT_POPULARITE = 1.1
+
+
+def _categories(noms):
+    # Dictionnaire trié, comme stockage.encoder_produits() au chargement
+    return pd.CategoricalDtype(sorted(noms))
+
+
+def generer_catalogue(nb_produits, graine=0, date_reception="2024-01-01"):
+    """
+    Catalogue de `nb_produits` lignes de stock : entre 5 et 50 catégories de
+    10 sous-catégories, prix log-normaux arrondis à 50 Fbu, quantités entre
+    0 et 200 (Quantite_initiale = Quantite tant qu'aucune vente n'est générée).
+    """
+    rng = np.random.default_rng(graine)
+    nb_categories = min(50, max(5, nb_produits // 100))
+    categories = [f"Categorie {c:02d}" for c in range(nb_categories)]
+    sous_categories = [
+        f"Sous-categorie {c:02d}-{s}" for c in range(nb_categories) for s in range(SOUS_CATEGORIES_PAR_CATEGORIE)
+    ]
+    produits = [f"Produit {p:07d}" for p in range(nb_produits)]
+
+    # Noms à largeur fixe : l'ordre de création est aussi l'ordre trié des dictionnaires
+    code_categorie = rng.integers(0, nb_categories, nb_produits)
+    code_sous_categorie = code_categorie * SOUS_CATEGORIES_PAR_CATEGORIE + rng.integers(0, SOUS_CATEGORIES_PAR_CATEGORIE, nb_produits)
+    prix = np.maximum(50.0, np.round(rng.lognormal(mean=8, sigma=1.2, size=nb_produits) / 50) * 50)
+    quantites = rng.integers(0, 201, nb_produits).astype(float)
+    dates = pd.Timestamp(date_reception) + pd.to_timedelta(rng.integers(0, 365, nb_produits), unit="D")
+
+    return pd.DataFrame({
+        "Categorie": pd.Categorical.from_codes(code_categorie, dtype=_categories(categories)),
+        "Sous-categorie": pd.Categorical.from_codes(code_sous_categorie, dtype=_categories(sous_categories)),
+        "Produit": pd.Categorical.from_codes(np.arange(nb_produits), dtype=_categories(produits)),
+        "Prix unitaire": prix,
+        "Quantite": quantites,
+        "Date": dates,
+        "Quantite_initiale": quantites.copy(),
+    })
+
+
+def _prendre(colonne, positions):
+    # Lignes d'une colonne catégorielle par leurs codes, sans repasser par le texte
+    return pd.Categorical.from_codes(colonne.cat.codes.to_numpy()[positions], dtype=colonne.dtype)
+
+
+def generer_ventes(stock, nb_ventes, graine=0, debut="2024-01-01", nb_jours=730):
+    """
+    Historique de `nb_ventes` ventes des produits de `stock`, triées par date
+    sur `nb_jours` jours à partir de `debut`. Les produits sont tirés selon une
+    loi de popularité, de 1 à 5 unités, au prix du stock.
+    """
+    rng = np.random.default_rng(graine + 1)
+    nb_produits = len(stock)
+    popularite = 1.0 / np.arange(1, nb_produits + 1) ** EXPOSANT_POPULARITE
+    popularite = popularite[rng.permutation(nb_produits)]
+    positions = rng.choice(nb_produits, size=nb_ventes, p=popularite / popularite.sum())
+    quantites = rng.integers(1, 6, nb_ventes).astype(float)
+    jours = np.sort(rng.integers(0, nb_jours, nb_ventes))
+    prix = stock["Prix unitaire"].to_numpy()[positions]
+
+    return pd.DataFrame({
+        "Categorie": _prendre(stock["Categorie"], positions),
+        "Sous-categorie": _prendre(stock["Sous-categorie"], positions),
+        "Produit": _prendre(stock["Produit"], positions),
+        "Prix unitaire": prix,
+        "Quantite vendue": quantites,
+        "Date": pd.Timestamp(debut) + pd.to_timedelta(jours, unit="D"),
+        "Total": prix * quantites,
+    })
+
+
+def generer_boutique(nb_produits, nb_ventes, graine=0):
+    """
+    Retourne (stock, ventes) cohérents : la quantité initiale de chaque
+    produit est sa quantité restante plus les unités vendues.
+    """
+    stock = generer_catalogue(nb_produits, graine)
+    ventes = generer_ventes(stock, nb_ventes, graine)
+    vendues = np.bincount(ventes["Produit"].cat.codes.to_numpy(), weights=ventes["Quantite vendue"].to_numpy(), minlength=nb_produits)
+    stock["Quantite_initiale"] = stock["Quantite"] + vendues
+    return stock, ventes
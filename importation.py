@@ -0,0 +1,258 @@
+import csv
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from stockage import COLONNES_STOCK, COLONNES_VENTES, concat_lignes, convertir_dates
+
+
+def lire_fichier(chemin, nom=None):
+    """
+    Lit un fichier importé (CSV ou Excel) dans un DataFrame. Lève ValueError
+    si le format n'est pas pris en charge, si le fichier est vide ou s'il est
+    illisible.
+    """
+    extension = os.path.splitext(nom or chemin)[1].lower()
+    if extension not in (".csv", ".xlsx", ".xls"):
+        raise ValueError(f"Format de fichier non pris en charge : {extension or nom}")
+    if os.path.getsize(chemin) == 0:
+        raise ValueError("Le fichier est vide.")
+    try:
+        if extension == ".csv":
+            # Séparateur détecté automatiquement : "," ou ";" selon le logiciel de caisse
+            lignes = pd.read_csv(chemin, sep=None, engine="python")
+        else:
+            lignes = pd.read_excel(chemin)
+    except ImportError as erreur:
+        raise ValueError("La lecture des fichiers Excel nécessite le paquet openpyxl (xlrd pour .xls).") from erreur
+    except pd.errors.EmptyDataError as erreur:
+        raise ValueError("Le fichier est vide.") from erreur
+    except csv.Error as erreur:
+        raise ValueError("Fichier CSV illisible : séparateur de colonnes introuvable (« , » ou « ; » attendu).") from erreur
+    except UnicodeDecodeError as erreur:
+        raise ValueError("Fichier CSV illisible : encodage non reconnu (UTF-8 attendu).") from erreur
+    except zipfile.BadZipFile as erreur:
+        raise ValueError("Fichier Excel illisible : le fichier est corrompu.") from erreur
+    except Exception as erreur:
+        # Autres erreurs des lecteurs CSV et Excel (fichier mal formé ou d'un autre format)
+        raise ValueError(f"Fichier {extension[1:].upper()} illisible : {erreur}") from erreur
+    if lignes.empty:
+        raise ValueError("Le fichier est vide.")
+    lignes.columns = [str(colonne).strip() for colonne in lignes.columns]
+    return lignes.reset_index(drop=True)
+
+
+def _verifier_colonnes(lignes, obligatoires):
+    manquantes = [colonne for colonne in obligatoires if colonne not in lignes.columns]
+    if manquantes:
+        raise ValueError(f"Colonnes manquantes dans le fichier : {', '.join(manquantes)}")
+
+def _texte(lignes, colonne):
+    # Colonne texte nettoyée ("" si absente ou vide)
+    if colonne not in lignes.columns:
+        return pd.Series("", index=lignes.index, dtype=object)
+    return lignes[colonne].astype(object).where(lignes[colonne].notna(), "").astype(str).str.strip()
+
+def _nombre(lignes, colonne):
+    if colonne not in lignes.columns:
+        return pd.Series(np.nan, index=lignes.index)
+    return pd.to_numeric(lignes[colonne], errors="coerce")
+
+def _dates(lignes, aujourd_hui):
+    # Date absente ou vide : date du jour ; date illisible : NaT (ligne rejetée)
+    if "Date" not in lignes.columns:
+        return pd.Series(aujourd_hui, index=lignes.index)
+    dates = convertir_dates(lignes["Date"])
+    return dates.where(lignes["Date"].notna(), aujourd_hui)
+
+def premieres_positions(stock, cles, colonnes):
+    """
+    Position dans le stock de la première ligne ayant la même clé que chaque
+    ligne de `cles` (NaN si absente), par une seule jointure.
+    """
+    # Colonnes produit (catégories) comparées comme texte, prix comme nombres
+    table = pd.DataFrame({
+        colonne: stock[colonne].astype(object) if isinstance(stock[colonne].dtype, pd.CategoricalDtype) else stock[colonne]
+        for colonne in colonnes
+    })
+    table["position"] = np.arange(len(stock), dtype=float)
+    table = table.drop_duplicates(colonnes, keep="first")
+    return cles[colonnes].merge(table, on=colonnes, how="left")["position"].to_numpy()
+
+def rapport_rejets(lignes, motifs):
+    """
+    Lignes rejetées : numéro de ligne dans le fichier (en-tête = ligne 1), produit et motif.
+    """
+    rejetees = motifs.notna().to_numpy()
+    return pd.DataFrame({
+        "Ligne": np.flatnonzero(rejetees) + 2,
+        "Categorie": _texte(lignes, "Categorie")[rejetees].to_numpy(),
+        "Produit": _texte(lignes, "Produit")[rejetees].to_numpy(),
+        "Motif": motifs[rejetees].to_numpy(),
+    })
+
+
+def importer_ventes(stock, ventes, lignes, aujourd_hui):
+    """
+    Valide toutes les lignes d'un fichier de ventes en une passe vectorisée et
+    applique les ventes acceptées.
+
+    Colonnes obligatoires : Categorie, Produit, Quantite vendue. Facultatives :
+    Sous-categorie (précise le produit), Prix unitaire (prix du stock par
+    défaut), Date (date du jour par défaut).
+
+    Les lignes sont servies dans l'ordre du fichier : dès que le cumul des
+    quantités d'un produit dépasse son stock, cette ligne et les suivantes
+    de ce produit sont rejetées.
+
+    Retourne (stock, ventes, operation, rejets) ; operation vaut
+    ("ventes_import", détails) à publier, ou None si aucune ligne n'est acceptée.
+    """
+    _verifier_colonnes(lignes, ["Categorie", "Produit", "Quantite vendue"])
+    motifs = pd.Series(None, index=lignes.index, dtype=object)
+
+    cles = pd.DataFrame({
+        "Categorie": _texte(lignes, "Categorie"),
+        "Sous-categorie": _texte(lignes, "Sous-categorie"),
+        "Produit": _texte(lignes, "Produit"),
+    })
+    quantites = _nombre(lignes, "Quantite vendue")
+    prix = _nombre(lignes, "Prix unitaire")
+    dates = _dates(lignes, aujourd_hui)
+
+    # Produit vendu : première ligne du stock pour (Categorie, Produit), ou pour
+    # (Categorie, Sous-categorie, Produit) quand la sous-catégorie est renseignée
+    positions = premieres_positions(stock, cles, ["Categorie", "Produit"])
+    avec_sous_categorie = (cles["Sous-categorie"] != "").to_numpy()
+    if avec_sous_categorie.any():
+        positions = np.where(
+            avec_sous_categorie,
+            premieres_positions(stock, cles, ["Categorie", "Sous-categorie", "Produit"]),
+            positions,
+        )
+
+    # Motifs de rejet, du plus grave au moins grave (le premier trouvé est gardé)
+    motifs = motifs.mask(motifs.isna() & ~(quantites > 0), "Quantité invalide")
+    motifs = motifs.mask(motifs.isna() & dates.isna(), "Date invalide")
+    motifs = motifs.mask(motifs.isna() & np.isnan(positions), "Produit inconnu")
+
+    candidates = motifs.isna().to_numpy()
+    disponibles = stock["Quantite"].to_numpy(dtype=float)
+    position_candidates = positions[candidates].astype(np.int64)
+    cumuls = quantites[candidates].groupby(position_candidates).cumsum().to_numpy()
+    insuffisantes = np.zeros(len(lignes), dtype=bool)
+    insuffisantes[np.flatnonzero(candidates)] = cumuls > disponibles[position_candidates]
+    motifs = motifs.mask(insuffisantes, "Quantité insuffisante")
+
+    acceptees = motifs.isna().to_numpy()
+    rejets = rapport_rejets(lignes, motifs)
+    if not acceptees.any():
+        return stock, ventes, None, rejets
+
+    # Ventes acceptées : identité du produit reprise du stock, prix du stock si non renseigné
+    position_acceptees = positions[acceptees].astype(np.int64)
+    prix_stock = stock["Prix unitaire"].to_numpy(dtype=float)[position_acceptees]
+    prix_vente = prix[acceptees].to_numpy()
+    prix_vente = np.where(prix_vente > 0, prix_vente, prix_stock)
+    quantites_vendues = quantites[acceptees].to_numpy(dtype=float)
+    nouvelles_ventes = pd.DataFrame({
+        "Categorie": stock["Categorie"].to_numpy()[position_acceptees],
+        "Sous-categorie": stock["Sous-categorie"].to_numpy()[position_acceptees],
+        "Produit": stock["Produit"].to_numpy()[position_acceptees],
+        "Prix unitaire": prix_vente,
+        "Quantite vendue": quantites_vendues,
+        "Date": dates[acceptees].to_numpy(),
+        "Total": prix_vente * quantites_vendues,
+    }, columns=COLONNES_VENTES)
+
+    # Décréments du stock en une passe : total vendu par position
+    vendues = pd.Series(quantites_vendues).groupby(position_acceptees).sum()
+    stock = stock.copy()
+    colonne_quantite = stock.columns.get_loc("Quantite")
+    restantes = disponibles[vendues.index.to_numpy()] - vendues.to_numpy()
+    stock.iloc[vendues.index.to_numpy(), colonne_quantite] = restantes
+
+    ventes = concat_lignes(ventes, nouvelles_ventes)
+    operation = ("ventes_import", {
+        "lignes": nouvelles_ventes.to_dict("records"),
+        "quantites": list(zip(vendues.index.tolist(), restantes.tolist())),
+    })
+    return stock, ventes, operation, rejets
+
+
+def receptionner_stock(stock, lignes, aujourd_hui):
+    """
+    Intègre une livraison fournisseur au stock en une seule fusion vectorisée.
+
+    Colonnes obligatoires : Categorie, Produit, Prix unitaire, Quantite ;
+    Sous-categorie facultative. Comme pour un ajout manuel, la clé d'un produit
+    est (Categorie, Sous-categorie, Produit, Prix unitaire) : une clé déjà en
+    stock voit sa quantité augmentée, une clé nouvelle crée une ligne (les
+    lignes du fichier ayant la même clé sont regroupées). Sans sous-catégorie,
+    une ligne reçue s'ajoute à la première ligne du stock ayant la même
+    (Categorie, Produit, Prix unitaire), comme pour importer_ventes().
+
+    Retourne (stock, operation, rejets) ; operation vaut ("stock_import",
+    détails) à publier, ou None si aucune ligne n'est acceptée.
+    """
+    _verifier_colonnes(lignes, ["Categorie", "Produit", "Prix unitaire", "Quantite"])
+    motifs = pd.Series(None, index=lignes.index, dtype=object)
+
+    cles = pd.DataFrame({
+        "Categorie": _texte(lignes, "Categorie"),
+        "Sous-categorie": _texte(lignes, "Sous-categorie"),
+        "Produit": _texte(lignes, "Produit"),
+        "Prix unitaire": _nombre(lignes, "Prix unitaire"),
+    })
+    quantites = _nombre(lignes, "Quantite")
+
+    motifs = motifs.mask((cles["Categorie"] == "") | (cles["Produit"] == ""), "Catégorie ou produit manquant")
+    motifs = motifs.mask(motifs.isna() & ~(cles["Prix unitaire"] >= 0), "Prix invalide")
+    motifs = motifs.mask(motifs.isna() & ~(quantites > 0), "Quantité invalide")
+    acceptees = motifs.isna().to_numpy()
+    rejets = rapport_rejets(lignes, motifs)
+    if not acceptees.any():
+        return stock, None, rejets
+
+    # Quantité reçue par clé, dans l'ordre de première apparition dans le fichier
+    colonnes_cle = ["Categorie", "Sous-categorie", "Produit", "Prix unitaire"]
+    recues = cles[acceptees].assign(Quantite=quantites[acceptees]).groupby(colonnes_cle, sort=False, as_index=False)["Quantite"].sum()
+    positions = premieres_positions(stock, recues, colonnes_cle) if not stock.empty else np.full(len(recues), np.nan)
+    sans_sous_categorie = (recues["Sous-categorie"] == "").to_numpy()
+    if sans_sous_categorie.any() and not stock.empty:
+        positions = np.where(
+            sans_sous_categorie,
+            premieres_positions(stock, recues, ["Categorie", "Produit", "Prix unitaire"]),
+            positions,
+        )
+    existantes = ~np.isnan(positions)
+
+    # Clés déjà en stock : quantités augmentées en une affectation (cumulées par ligne,
+    # une clé sans sous-catégorie pouvant désigner la même ligne qu'une clé complète)
+    stock = stock.copy()
+    ajouts = pd.Series(recues["Quantite"].to_numpy()[existantes]).groupby(positions[existantes].astype(np.int64), sort=False).sum()
+    position_existantes = ajouts.index.to_numpy()
+    nouvelles_quantites = stock["Quantite"].to_numpy(dtype=float)[position_existantes] + ajouts.to_numpy()
+    stock.iloc[position_existantes, stock.columns.get_loc("Quantite")] = nouvelles_quantites
+
+    # Clés nouvelles : lignes ajoutées en un seul concat
+    nouvelles = recues[~existantes]
+    nouveaux_produits = pd.DataFrame({
+        "Categorie": nouvelles["Categorie"].to_numpy(),
+        "Sous-categorie": nouvelles["Sous-categorie"].to_numpy(),
+        "Produit": nouvelles["Produit"].to_numpy(),
+        "Prix unitaire": nouvelles["Prix unitaire"].to_numpy(dtype=float),
+        "Quantite": nouvelles["Quantite"].to_numpy(dtype=float),
+        "Date": aujourd_hui,
+        "Quantite_initiale": nouvelles["Quantite"].to_numpy(dtype=float),
+    }, columns=COLONNES_STOCK)
+    if len(nouveaux_produits):
+        stock = concat_lignes(stock, nouveaux_produits)
+
+    operation = ("stock_import", {
+        "quantites": list(zip(position_existantes.tolist(), nouvelles_quantites.tolist())),
+        "lignes": nouveaux_produits.to_dict("records"),
+    })
+    return stock, operation, rejets
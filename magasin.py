@@ -0,0 +1,983 @@
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from stockage import ajouter_categories, concat_lignes
+
+
+class IndexProduits:
+    """
+    Index de hachage clé produit -> position de la ligne dans le stock.
+
+    Chaque ligne reçoit un identifiant interne croissant ; les dictionnaires
+    associent une clé aux identifiants, et la liste triée des identifiants
+    vivants donne la position par recherche binaire. Ajout, modification et
+    suppression mettent l'index à jour sans le reconstruire.
+    """
+
+    def __init__(self, stock):
+        self.reconstruire(stock)
+
+    @staticmethod
+    def cle(categorie, sous_categorie, produit, prix_unitaire):
+        return (categorie, sous_categorie, produit, float(prix_unitaire))
+
+    def reconstruire(self, stock):
+        self._prochain_id = 0
+        self.ids = []
+        self.cles = {}
+        # (Categorie, Sous-categorie, Produit, Prix unitaire) -> identifiants
+        self.par_cle = {}
+        # (Categorie, Produit) et (Categorie, Sous-categorie, Produit) -> identifiants
+        self.par_produit = {}
+        self.par_sous_categorie = {}
+        if stock.empty:
+            return
+        for ligne in zip(stock["Categorie"], stock["Sous-categorie"], stock["Produit"], stock["Prix unitaire"]):
+            self._indexer(self._nouvel_id(), self.cle(*ligne))
+
+    def _nouvel_id(self):
+        identifiant = self._prochain_id
+        self._prochain_id += 1
+        self.ids.append(identifiant)
+        return identifiant
+
+    def _indexer(self, identifiant, cle):
+        self.cles[identifiant] = cle
+        insort(self.par_cle.setdefault(cle, []), identifiant)
+        insort(self.par_produit.setdefault((cle[0], cle[2]), []), identifiant)
+        insort(self.par_sous_categorie.setdefault(cle[:3], []), identifiant)
+
+    def _desindexer(self, identifiant):
+        cle = self.cles.pop(identifiant)
+        for dictionnaire, sous_cle in (
+            (self.par_cle, cle),
+            (self.par_produit, (cle[0], cle[2])),
+            (self.par_sous_categorie, cle[:3]),
+        ):
+            identifiants = dictionnaire[sous_cle]
+            identifiants.remove(identifiant)
+            if not identifiants:
+                del dictionnaire[sous_cle]
+
+    def _position(self, identifiants):
+        if not identifiants:
+            return None
+        # Première ligne correspondante, comme stock[mask].index[0]
+        return bisect_left(self.ids, identifiants[0])
+
+    def ajouter(self, ligne):
+        self._indexer(self._nouvel_id(), self.cle(
+            ligne["Categorie"], ligne["Sous-categorie"], ligne["Produit"], ligne["Prix unitaire"]
+        ))
+
+    def modifier(self, position, ligne):
+        identifiant = self.ids[position]
+        self._desindexer(identifiant)
+        self._indexer(identifiant, self.cle(
+            ligne["Categorie"], ligne["Sous-categorie"], ligne["Produit"], ligne["Prix unitaire"]
+        ))
+
+    def supprimer(self, position):
+        self._desindexer(self.ids.pop(position))
+
+    def chercher(self, categorie, sous_categorie, produit, prix_unitaire):
+        """
+        Position de la première ligne ayant exactement cette clé, ou None.
+        """
+        return self._position(self.par_cle.get(self.cle(categorie, sous_categorie, produit, prix_unitaire)))
+
+    def chercher_produit(self, categorie, produit, sous_categorie=None):
+        """
+        Position de la première ligne de ce produit (dans cette sous-catégorie si précisée), ou None.
+        """
+        if sous_categorie is None:
+            return self._position(self.par_produit.get((categorie, produit)))
+        return self._position(self.par_sous_categorie.get((categorie, sous_categorie, produit)))
+
+
+class Hierarchie:
+    """
+    Hiérarchie catégorie -> sous-catégorie -> produit construite en une passe
+    sur le stock. Les listes gardent l'ordre de première apparition, comme
+    .unique(). Un paramètre à None signifie "pas de filtre" sur ce niveau.
+    """
+
+    def __init__(self, stock):
+        self._categories = {}
+        self._sous_categories = {}
+        self._toutes_sous_categories = {}
+        self._produits = {}
+        self._produits_categorie = {}
+        self._produits_sous_categorie = {}
+        self._tous_produits = {}
+        if stock.empty:
+            return
+        for categorie, sous_categorie, produit in zip(stock["Categorie"], stock["Sous-categorie"], stock["Produit"]):
+            self._categories[categorie] = None
+            self._sous_categories.setdefault(categorie, {})[sous_categorie] = None
+            self._toutes_sous_categories[sous_categorie] = None
+            self._produits.setdefault((categorie, sous_categorie), {})[produit] = None
+            self._produits_categorie.setdefault(categorie, {})[produit] = None
+            self._produits_sous_categorie.setdefault(sous_categorie, {})[produit] = None
+            self._tous_produits[produit] = None
+
+    def vide(self):
+        return not self._categories
+
+    def categories(self):
+        return list(self._categories)
+
+    def sous_categories(self, categorie=None):
+        if categorie is None:
+            return list(self._toutes_sous_categories)
+        return list(self._sous_categories.get(categorie, ()))
+
+    def produits(self, categorie=None, sous_categorie=None):
+        if categorie is None and sous_categorie is None:
+            return list(self._tous_produits)
+        if categorie is None:
+            return list(self._produits_sous_categorie.get(sous_categorie, ()))
+        if sous_categorie is None:
+            return list(self._produits_categorie.get(categorie, ()))
+        return list(self._produits.get((categorie, sous_categorie), ()))
+
+
+def _nombre(valeur):
+    # Cellule vide ou NaN comptée comme 0, comme fillna(0) au chargement
+    try:
+        valeur = float(valeur)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(valeur) else valeur
+
+
+class Totaux:
+    """
+    Agrégats du tableau de bord : valeur du stock (somme prix x quantité),
+    montant total des ventes et nombre d'unités vendues.
+
+    Les instances ne sont jamais modifiées : appliquer() retourne de nouveaux
+    totaux, ce qui permet de les lire sans verrou.
+    """
+
+    CLES = ("valeur_stock", "montant_ventes", "unites_vendues")
+
+    def __init__(self, valeur_stock=0.0, montant_ventes=0.0, unites_vendues=0.0):
+        self.valeur_stock = float(valeur_stock)
+        self.montant_ventes = float(montant_ventes)
+        self.unites_vendues = float(unites_vendues)
+
+    @classmethod
+    def calculer(cls, stock, ventes):
+        """
+        Calcul complet sur les DataFrames (démarrage sans totaux enregistrés).
+        """
+        valeur_stock = 0.0
+        if not stock.empty:
+            valeur_stock = (stock["Prix unitaire"].fillna(0) * stock["Quantite"].fillna(0)).sum()
+        montant_ventes = unites_vendues = 0.0
+        if not ventes.empty:
+            montant_ventes = ventes["Total"].fillna(0).sum()
+            unites_vendues = ventes["Quantite vendue"].fillna(0).sum()
+        return cls(valeur_stock, montant_ventes, unites_vendues)
+
+    @classmethod
+    def depuis_dict(cls, valeurs):
+        if not valeurs or any(cle not in valeurs for cle in cls.CLES):
+            return None
+        return cls(*(valeurs[cle] for cle in cls.CLES))
+
+    def en_dict(self):
+        return {cle: getattr(self, cle) for cle in self.CLES}
+
+    def appliquer(self, valeur_stock=0.0, montant_ventes=0.0, unites_vendues=0.0):
+        """
+        Nouveaux totaux après ajout des différences données.
+        """
+        return Totaux(
+            self.valeur_stock + valeur_stock,
+            self.montant_ventes + montant_ventes,
+            self.unites_vendues + unites_vendues,
+        )
+
+
+def pourcentages_stock(stock, ventes):
+    """
+    Copie du stock avec Quantite_initiale et Pourcentage_restant (arrondi à
+    0,01 ; 0 si indéfini). Sans colonne Quantite_initiale, la quantité
+    initiale est estimée par la quantité restante plus le total vendu du
+    produit (Categorie, Produit), en un seul groupby suivi d'une jointure.
+    """
+    stock = stock.copy()
+    if "Quantite_initiale" not in stock.columns:
+        vendues = np.zeros(len(stock))
+        if not ventes.empty:
+            cles = ["Categorie", "Produit"]
+            totaux_produit = ventes.groupby(cles, observed=True, as_index=False)["Quantite vendue"].sum()
+            vendues = stock[cles].merge(totaux_produit, on=cles, how="left")["Quantite vendue"].fillna(0).to_numpy()
+        stock["Quantite_initiale"] = stock["Quantite"].to_numpy(dtype=float) + vendues
+    stock["Pourcentage_restant"] = pourcentage_restant(
+        stock["Quantite"].to_numpy(dtype=float), stock["Quantite_initiale"].to_numpy(dtype=float)
+    )
+    return stock
+
+def pourcentage_restant(quantites, quantites_initiales):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pourcentages = np.round(quantites / quantites_initiales * 100, 2)
+    return np.where(np.isnan(pourcentages), 0.0, pourcentages)
+
+
+# Niveaux d'alerte du stock selon le pourcentage restant de la quantité initiale
+SEUIL_CRITIQUE = 20
+SEUIL_FAIBLE = 40
+NORMAL, FAIBLE, CRITIQUE = 0, 1, 2
+
+def niveaux_alerte(pourcentages):
+    return np.where(pourcentages <= SEUIL_CRITIQUE, CRITIQUE, np.where(pourcentages <= SEUIL_FAIBLE, FAIBLE, NORMAL))
+
+
+class AlertesStock:
+    """
+    Lignes du stock en niveau critique (<= 20 %) ou faible (<= 40 %), tenues à
+    jour ligne par ligne : une mutation ne réévalue que les lignes qu'elle
+    touche (une vente : une seule ligne).
+
+    Chaque changement de niveau produit un événement numéroté (entrée en stock
+    critique, retour à la normale...), gardé dans un historique borné où les
+    sessions lisent ceux qu'elles n'ont pas encore vus.
+    """
+
+    def __init__(self, stock, ventes, taille_historique=100):
+        self.sequence = 0
+        self.evenements = deque(maxlen=taille_historique)
+        self.reconstruire(stock, ventes)
+
+    def reconstruire(self, stock, ventes):
+        self.niveaux = niveaux_alerte(pourcentages_stock(stock, ventes)["Pourcentage_restant"].to_numpy())
+        self.positions = {
+            CRITIQUE: set(np.flatnonzero(self.niveaux == CRITIQUE).tolist()),
+            FAIBLE: set(np.flatnonzero(self.niveaux == FAIBLE).tolist()),
+        }
+
+    def evaluer(self, stock, positions):
+        """
+        Réévalue les lignes `positions` du stock (qui a une colonne Quantite_initiale).
+        """
+        if not len(positions):
+            return
+        positions = np.asarray(positions, dtype=np.int64)
+        niveaux = niveaux_alerte(pourcentage_restant(
+            stock["Quantite"].to_numpy(dtype=float)[positions],
+            stock["Quantite_initiale"].to_numpy(dtype=float)[positions],
+        ))
+        for position, niveau in zip(positions.tolist(), niveaux.tolist()):
+            ancien = int(self.niveaux[position])
+            if niveau == ancien:
+                continue
+            self.niveaux[position] = niveau
+            self.positions.get(ancien, set()).discard(position)
+            if niveau != NORMAL:
+                self.positions[niveau].add(position)
+            self.sequence += 1
+            self.evenements.append({
+                "sequence": self.sequence,
+                "categorie": stock["Categorie"].iat[position],
+                "produit": stock["Produit"].iat[position],
+                "ancien": ancien,
+                "niveau": niveau,
+            })
+
+    def ajouter(self, stock, nombre):
+        # Lignes ajoutées en fin de stock, considérées normales avant évaluation
+        self.niveaux = np.append(self.niveaux, np.full(nombre, NORMAL, dtype=self.niveaux.dtype))
+        self.evaluer(stock, np.arange(len(stock) - nombre, len(stock)))
+
+    def supprimer(self, position):
+        self.niveaux = np.delete(self.niveaux, position)
+        for niveau, positions in self.positions.items():
+            self.positions[niveau] = {p - 1 if p > position else p for p in positions if p != position}
+
+    def lignes(self, stock, niveau):
+        """
+        Lignes du stock du niveau demandé, dans l'ordre du stock, avec leur pourcentage restant.
+        """
+        lignes = stock.iloc[sorted(self.positions[niveau])].copy()
+        lignes["Pourcentage_restant"] = pourcentage_restant(
+            lignes["Quantite"].to_numpy(dtype=float), lignes["Quantite_initiale"].to_numpy(dtype=float)
+        )
+        return lignes
+
+    def depuis(self, sequence):
+        """
+        Événements postérieurs au numéro `sequence`.
+        """
+        return [evenement for evenement in self.evenements if evenement["sequence"] > sequence]
+
+
+def _jour(valeur):
+    # Jour d'une vente (minuit), quel que soit le format reçu ; NaT si inconnu
+    if isinstance(valeur, str):
+        valeur = pd.to_datetime(valeur, format="mixed", dayfirst=True, errors="coerce")
+    valeur = pd.Timestamp(valeur) if not pd.isna(valeur) else pd.NaT
+    return valeur.normalize() if not pd.isna(valeur) else pd.NaT
+
+
+class CubeVentes:
+    """
+    Ventes pré-agrégées par jour et par produit :
+    (jour, Categorie, Sous-categorie, Produit) -> [nombre de ventes, quantité, montant].
+
+    Les jours sont gardés triés : une période se lit par recherche binaire, puis
+    en ne parcourant que les cellules de ses jours. Chaque vente ou suppression
+    de vente met à jour une seule cellule.
+    """
+
+    def __init__(self, ventes):
+        self.reconstruire(ventes)
+
+    def reconstruire(self, ventes):
+        self.jours = []
+        self.cellules = {}
+        # Ventes sans date lisible : comptées seulement quand aucune période n'est choisie
+        self.sans_date = {}
+        if ventes.empty:
+            return
+        dates = ventes["Date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, format="mixed", dayfirst=True, errors="coerce")
+        groupes = pd.DataFrame({
+            "Jour": dates.dt.normalize(),
+            "Categorie": ventes["Categorie"],
+            "Sous-categorie": ventes["Sous-categorie"],
+            "Produit": ventes["Produit"],
+            "Quantite vendue": ventes["Quantite vendue"].fillna(0),
+            "Total": ventes["Total"].fillna(0),
+        }).groupby(["Jour", "Categorie", "Sous-categorie", "Produit"], dropna=False, sort=False).agg(
+            nombre=("Total", "size"), quantite=("Quantite vendue", "sum"), montant=("Total", "sum")
+        )
+        for (jour, *cle), nombre, quantite, montant in zip(
+            groupes.index, groupes["nombre"], groupes["quantite"], groupes["montant"]
+        ):
+            self._cellules_du_jour(jour)[tuple(cle)] = [int(nombre), float(quantite), float(montant)]
+
+    def _cellules_du_jour(self, jour, creer=True):
+        if pd.isna(jour):
+            return self.sans_date
+        if jour not in self.cellules:
+            if not creer:
+                return None
+            insort(self.jours, jour)
+            self.cellules[jour] = {}
+        return self.cellules[jour]
+
+    def _appliquer(self, ligne, signe):
+        jour = _jour(ligne["Date"])
+        cellules = self._cellules_du_jour(jour, creer=signe > 0)
+        cle = (ligne["Categorie"], ligne["Sous-categorie"], ligne["Produit"])
+        if cellules is None or (signe < 0 and cle not in cellules):
+            return
+        cellule = cellules.setdefault(cle, [0, 0.0, 0.0])
+        cellule[0] += signe
+        cellule[1] += signe * _nombre(ligne["Quantite vendue"])
+        cellule[2] += signe * _nombre(ligne["Total"])
+        if cellule[0] <= 0:
+            del cellules[cle]
+            if not cellules and not pd.isna(jour):
+                del self.cellules[jour]
+                del self.jours[bisect_left(self.jours, jour)]
+
+    def ajouter(self, ligne):
+        self._appliquer(ligne, 1)
+
+    def retirer(self, ligne):
+        self._appliquer(ligne, -1)
+
+    def _periode(self, date_debut=None, date_fin=None):
+        """
+        (jour, cellules du jour) pour les jours de la période, bornes incluses.
+        """
+        debut = 0 if date_debut is None else bisect_left(self.jours, pd.Timestamp(date_debut))
+        fin = len(self.jours) if date_fin is None else bisect_right(self.jours, pd.Timestamp(date_fin))
+        if date_debut is None and date_fin is None and self.sans_date:
+            yield pd.NaT, self.sans_date
+        for jour in self.jours[debut:fin]:
+            yield jour, self.cellules[jour]
+
+    def par_produit(self, date_debut=None, date_fin=None, categorie=None, sous_categorie=None, produit=None):
+        """
+        Quantité vendue et total par (Categorie, Sous-categorie, Produit) sur la période.
+        """
+        resultat = {}
+        for _, cellules in self._periode(date_debut, date_fin):
+            for cle, (_, quantite, montant) in cellules.items():
+                if (
+                    (categorie is not None and cle[0] != categorie)
+                    or (sous_categorie is not None and cle[1] != sous_categorie)
+                    or (produit is not None and cle[2] != produit)
+                ):
+                    continue
+                total = resultat.setdefault(cle, [0.0, 0.0])
+                total[0] += quantite
+                total[1] += montant
+        return pd.DataFrame(
+            [(*cle, quantite, montant) for cle, (quantite, montant) in resultat.items()],
+            columns=["Categorie", "Sous-categorie", "Produit", "Quantite vendue", "Total"],
+        )
+
+    def par_categorie_et_jour(self, date_debut=None, date_fin=None):
+        """
+        Quantité vendue et total par (Categorie, Date) sur la période, triés par date.
+        """
+        lignes = []
+        for jour, cellules in self._periode(date_debut, date_fin):
+            par_categorie = {}
+            for cle, (_, quantite, montant) in cellules.items():
+                total = par_categorie.setdefault(cle[0], [0.0, 0.0])
+                total[0] += quantite
+                total[1] += montant
+            lignes.extend((categorie, jour, total[1], total[0]) for categorie, total in par_categorie.items())
+        return pd.DataFrame(lignes, columns=["Categorie", "Date", "Total", "Quantite vendue"])
+
+
+class IndexDates:
+    """
+    Positions des ventes triées par jour de vente : une période se lit par
+    deux recherches binaires et une tranche, son coût dépend du nombre de
+    ventes de la période et non de tout l'historique.
+
+    Les ventes arrivent dans l'ordre chronologique, l'ajout se fait donc
+    presque toujours en fin de liste. Une suppression décale les positions
+    suivantes (parcours linéaire, opération rare).
+    """
+
+    def __init__(self, ventes):
+        self.reconstruire(ventes)
+
+    @staticmethod
+    def _numero(jour):
+        # Numéro de jour (ordinal) comparable par bisect
+        return jour.toordinal()
+
+    def reconstruire(self, ventes):
+        self.jours = []
+        self.positions = []
+        if ventes.empty:
+            return
+        dates = ventes["Date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, format="mixed", dayfirst=True, errors="coerce")
+        jours = dates.dt.normalize()
+        valides = np.flatnonzero(jours.notna().to_numpy())
+        # Tri stable : à jour égal, les ventes restent dans l'ordre d'enregistrement
+        ordre = valides[np.argsort(jours.to_numpy()[valides], kind="stable")]
+        self.positions = ordre.tolist()
+        # Jours depuis 1970 + ordinal du 01-01-1970, soit date.toordinal() sans boucle Python
+        jours_epoque = jours.to_numpy(dtype="datetime64[ns]")[ordre].astype("datetime64[D]").astype(np.int64)
+        self.jours = (jours_epoque + 719163).tolist()
+
+    def ajouter(self, position, date):
+        jour = _jour(date)
+        if pd.isna(jour):
+            return
+        numero = self._numero(jour)
+        rang = bisect_right(self.jours, numero)
+        self.jours.insert(rang, numero)
+        self.positions.insert(rang, position)
+
+    def supprimer(self, position):
+        if position in self.positions:
+            rang = self.positions.index(position)
+            del self.jours[rang]
+            del self.positions[rang]
+        self.positions = [p - 1 if p > position else p for p in self.positions]
+
+    def periode(self, date_debut=None, date_fin=None):
+        """
+        Positions (dans l'ordre d'enregistrement) des ventes datées du jour
+        date_debut au jour date_fin inclus.
+        """
+        debut = 0 if date_debut is None else bisect_left(self.jours, self._numero(_jour(date_debut)))
+        fin = len(self.jours) if date_fin is None else bisect_right(self.jours, self._numero(_jour(date_fin)))
+        return np.sort(np.array(self.positions[debut:fin], dtype=np.int64))
+
+
+def position_jeton(jetons, jeton):
+    """
+    Position de la ligne portant `jeton` dans un tableau de jetons, ou None.
+    """
+    positions = np.flatnonzero(jetons == jeton)
+    return int(positions[0]) if len(positions) else None
+
+
+class Magasin:
+    """
+    Stock et ventes partagés par toutes les sessions Shiny du processus.
+
+    Les DataFrames publiés ne sont jamais modifiés : chaque mutation travaille
+    sur une copie puis la publie sous un nouveau numéro de version (copie à
+    l'écriture). Les sessions ne gardent que ce numéro de version.
+
+    Chaque ligne du stock porte aussi un jeton, renouvelé à chaque modification
+    de la ligne : une vente, une modification ou une suppression ne s'applique
+    au stock partagé que si le jeton lu n'a pas changé (compare-and-swap), sans
+    bloquer les autres produits. Chaque vente a de même son jeton, vérifié à
+    sa suppression. Les tableaux de jetons sont eux aussi copiés à l'écriture :
+    ils restent cohérents avec les DataFrames de la même version.
+
+    Le verrou ne couvre que la comparaison des versions et le remplacement :
+    les copies sont calculées avant, et l'écriture par le backend a lieu
+    après, dans l'ordre des versions.
+    """
+
+    def __init__(self, stockage, stock, ventes):
+        self.stockage = stockage
+        self._verrou = threading.RLock()
+        self.version = 0
+        self.stock = stock
+        self.ventes = ventes
+        self.index = IndexProduits(stock)
+        # Jetons des lignes du stock, jamais réutilisés
+        self._jeton_suivant = 0
+        self.jetons = self._attribuer_jetons(len(stock))
+        self.jetons_ventes = self._attribuer_jetons(len(ventes))
+        # Version du catalogue : ne change que si des clés produit changent (pas sur une vente)
+        self.version_catalogue = 0
+        self._hierarchie = None
+        self._pourcentages = None
+        # Totaux enregistrés par le backend, sinon un seul calcul complet
+        self.totaux = Totaux.depuis_dict(getattr(stockage, "totaux", None)) or Totaux.calculer(stock, ventes)
+        self.cube = CubeVentes(ventes)
+        self.dates = IndexDates(ventes)
+        self.alertes = AlertesStock(stock, ventes)
+        # Écritures du backend hors du verrou, dans l'ordre des versions
+        self._ecriture = threading.Condition()
+        self._version_ecrite = 0
+
+    def lire(self):
+        """
+        Retourne (version, stock, ventes) de façon cohérente.
+        """
+        with self._verrou:
+            return self.version, self.stock, self.ventes
+
+    def publier(self, stock=None, ventes=None, operation=None, version_attendue=None, **details):
+        """
+        Remplace le stock et/ou les ventes, persiste l'opération éventuelle et
+        retourne le nouveau numéro de version.
+
+        Avec `version_attendue`, la publication n'a lieu que si aucune autre
+        n'a eu lieu depuis cette version (les DataFrames ont été calculés à
+        partir d'elle) ; sinon rien n'est modifié et None est retourné.
+
+        L'opération est persistée après la libération du verrou : les autres
+        sessions lisent et publient pendant l'écriture, le backend reçoit les
+        opérations dans l'ordre des versions.
+        """
+        with self._verrou:
+            if version_attendue is not None and version_attendue != self.version:
+                return None
+            # Différences calculées sur l'état précédent, avant le remplacement
+            totaux = self._nouveaux_totaux(operation, details)
+            anciennes_ventes = self.ventes
+            ancien_stock = self.stock
+            if stock is not None:
+                self.stock = stock
+            if ventes is not None:
+                self.ventes = ventes
+            self.totaux = totaux if totaux is not None else Totaux.calculer(self.stock, self.ventes)
+            self.version += 1
+            self._mettre_a_jour_index(operation, details)
+            self._mettre_a_jour_jetons(operation, details, ancien_stock, anciennes_ventes)
+            self._mettre_a_jour_alertes(operation, details, ancien_stock)
+            self._mettre_a_jour_ventes(operation, details, anciennes_ventes)
+            version, stock, ventes, totaux = self.version, self.stock, self.ventes, self.totaux.en_dict()
+        self._persister(version, stock, ventes, operation, totaux, details)
+        return version
+
+    def _persister(self, version, stock, ventes, operation, totaux, details):
+        # Attendre l'écriture des versions précédentes : un journal doit recevoir les opérations dans l'ordre
+        with self._ecriture:
+            self._ecriture.wait_for(lambda: self._version_ecrite == version - 1)
+            try:
+                if operation is not None:
+                    self.stockage.enregistrer(stock, ventes, operation, totaux=totaux, **details)
+            finally:
+                self._version_ecrite = version
+                self._ecriture.notify_all()
+
+    def _appliquer(self, calculer, chercher=None):
+        """
+        Calcule une mutation hors du verrou à partir de la dernière version,
+        puis la publie si aucune autre publication n'a eu lieu entre-temps
+        (sinon recommence sur la nouvelle version).
+
+        calculer(stock, ventes, jetons, jetons_ventes) retourne (stock, ventes,
+        operation, details), ou None pour renoncer ; retourne la nouvelle
+        version, ou None. Avec `chercher`, appelé sous le verrou dans la même
+        version (recherche dans les index du magasin), son résultat est passé
+        à calculer en dernier argument.
+        """
+        while True:
+            with self._verrou:
+                version = self.version
+                etat = [self.stock, self.ventes, self.jetons, self.jetons_ventes]
+                if chercher is not None:
+                    etat.append(chercher())
+            resultat = calculer(*etat)
+            if resultat is None:
+                return None
+            stock, ventes, operation, details = resultat
+            nouvelle_version = self.publier(stock, ventes, operation, version_attendue=version, **details)
+            if nouvelle_version is not None:
+                return nouvelle_version
+
+    def lire_stock(self):
+        """
+        Retourne (stock, jetons) de la même version.
+        """
+        with self._verrou:
+            return self.stock, self.jetons
+
+    def lire_ventes(self):
+        """
+        Retourne (ventes, jetons des ventes) de la même version.
+        """
+        with self._verrou:
+            return self.ventes, self.jetons_ventes
+
+    def lire_produit(self, categorie, produit, sous_categorie=None):
+        """
+        Cherche un produit dans l'index et lit sa ligne dans la même version :
+        retourne (position, jeton, ligne), ou None s'il n'est pas en stock.
+        """
+        with self._verrou:
+            position = self.index.chercher_produit(categorie, produit, sous_categorie)
+            if position is None:
+                return None
+            return position, int(self.jetons[position]), self.stock.iloc[position]
+
+    def quantites_restantes(self, ventes):
+        """
+        Quantité en stock du produit de chaque vente de `ventes` (0 si le
+        produit n'est plus en stock), lue dans une seule version.
+        """
+        with self._verrou:
+            quantites = self.stock["Quantite"].to_numpy()
+            positions = [
+                self.index.chercher_produit(categorie, produit, sous_categorie)
+                for categorie, sous_categorie, produit in zip(ventes["Categorie"], ventes["Sous-categorie"], ventes["Produit"])
+            ]
+        return np.array([0.0 if position is None else quantites[position] for position in positions], dtype=float)
+
+    def lire_ligne(self, position):
+        """
+        Retourne (jeton, ligne) pour une ligne du stock partagé, ou None si la
+        position n'existe plus.
+        """
+        with self._verrou:
+            if not 0 <= position < len(self.stock):
+                return None
+            return int(self.jetons[position]), self.stock.iloc[position]
+
+    def vendre(self, position, jeton, nouvelle_vente):
+        """
+        Enregistre une vente (DataFrame d'une ligne) en décrémentant la ligne
+        `position` du stock partagé, à condition que son jeton soit toujours
+        `jeton`. Retourne la nouvelle version, ou None si la ligne a changé
+        depuis sa lecture par lire_ligne() : relire la ligne et recommencer.
+        """
+        def calculer(stock, ventes, jetons, jetons_ventes):
+            if not 0 <= position < len(jetons) or jetons[position] != jeton:
+                return None
+            stock = stock.copy()
+            colonne_quantite = stock.columns.get_loc("Quantite")
+            quantite_restante = stock.iat[position, colonne_quantite] - nouvelle_vente["Quantite vendue"].iat[0]
+            stock.iat[position, colonne_quantite] = quantite_restante
+            # S'assurer que la colonne Quantite_initiale existe
+            if "Quantite_initiale" not in stock.columns:
+                stock["Quantite_initiale"] = stock["Quantite"].copy()
+            ventes = concat_lignes(ventes, nouvelle_vente)
+            return stock, ventes, "vente", {
+                "ligne": nouvelle_vente.iloc[0], "stock_index": position, "quantite_restante": quantite_restante,
+            }
+        return self._appliquer(calculer)
+
+    def ajouter_produit(self, nouvelle_ligne):
+        """
+        Ajoute au stock une ligne (DataFrame d'une ligne) : sa quantité s'ajoute
+        à la ligne de même clé (Categorie, Sous-categorie, Produit, Prix
+        unitaire) si elle existe, sinon la ligne est créée. Retourne (version,
+        nouvelle quantité de la ligne existante, ou None si la ligne est créée).
+        """
+        ligne = nouvelle_ligne.iloc[0]
+        quantite = [None]
+
+        def chercher():
+            return self.index.chercher(ligne["Categorie"], ligne["Sous-categorie"], ligne["Produit"], ligne["Prix unitaire"])
+
+        def calculer(stock, ventes, jetons, jetons_ventes, position):
+            if position is None:
+                quantite[0] = None
+                return concat_lignes(stock, nouvelle_ligne), None, "stock_ajout", {"ligne": ligne}
+            stock = stock.copy()
+            colonne_quantite = stock.columns.get_loc("Quantite")
+            quantite[0] = stock.iat[position, colonne_quantite] + ligne["Quantite"]
+            stock.iat[position, colonne_quantite] = quantite[0]
+            return stock, None, "stock_maj", {"index": position, "ligne": stock.iloc[position]}
+
+        version = self._appliquer(calculer, chercher)
+        return version, quantite[0]
+
+    def modifier_ligne(self, jeton, ligne):
+        """
+        Remplace la ligne du stock portant le jeton `jeton` par `ligne`
+        (dictionnaire des colonnes du stock). Retourne la nouvelle version, ou
+        None si la ligne a été modifiée ou supprimée depuis sa lecture.
+        """
+        def calculer(stock, ventes, jetons, jetons_ventes):
+            position = position_jeton(jetons, jeton)
+            if position is None:
+                return None
+            # Les colonnes produit sont des catégories : déclarer d'abord les nouvelles valeurs
+            stock = ajouter_categories(stock.copy(), ligne)
+            stock.loc[position] = ligne
+            return stock, None, "stock_maj", {"index": position, "ligne": stock.loc[position]}
+        return self._appliquer(calculer)
+
+    def supprimer_ligne(self, jeton):
+        """
+        Supprime la ligne du stock portant le jeton `jeton`. Retourne la
+        nouvelle version, ou None si la ligne a été modifiée ou supprimée
+        depuis sa lecture.
+        """
+        def calculer(stock, ventes, jetons, jetons_ventes):
+            position = position_jeton(jetons, jeton)
+            if position is None:
+                return None
+            return stock.drop(position).reset_index(drop=True), None, "stock_suppression", {"index": position}
+        return self._appliquer(calculer)
+
+    def supprimer_vente(self, jeton):
+        """
+        Supprime la vente portant le jeton `jeton`. Retourne la nouvelle
+        version, ou None si elle a déjà été supprimée.
+        """
+        def calculer(stock, ventes, jetons, jetons_ventes):
+            position = position_jeton(jetons_ventes, jeton)
+            if position is None:
+                return None
+            return None, ventes.drop(position).reset_index(drop=True), "vente_suppression", {"index": position}
+        return self._appliquer(calculer)
+
+    def hierarchie(self):
+        """
+        Hiérarchie du catalogue, reconstruite au plus une fois par version du catalogue.
+        """
+        with self._verrou:
+            if self._hierarchie is None or self._hierarchie[0] != self.version_catalogue:
+                self._hierarchie = (self.version_catalogue, Hierarchie(self.stock))
+            return self._hierarchie[1]
+
+    def pourcentages_stock(self):
+        """
+        Pourcentages de stock restant (voir pourcentages_stock()), calculés au
+        plus une fois par version et partagés par toutes les sessions.
+        """
+        with self._verrou:
+            if self._pourcentages is None or self._pourcentages[0] != self.version:
+                self._pourcentages = (self.version, pourcentages_stock(self.stock, self.ventes))
+            return self._pourcentages[1]
+
+    def alertes_stock(self, niveau):
+        """
+        Lignes du stock au niveau d'alerte CRITIQUE ou FAIBLE, avec Quantite_initiale
+        et Pourcentage_restant, lues dans les ensembles tenus à jour par AlertesStock.
+        """
+        with self._verrou:
+            if "Quantite_initiale" not in self.stock.columns:
+                pourcentages = self.pourcentages_stock()
+                return pourcentages.iloc[sorted(self.alertes.positions[niveau])]
+            return self.alertes.lignes(self.stock, niveau)
+
+    def evenements_alerte(self, sequence):
+        """
+        Changements de niveau d'alerte postérieurs au numéro `sequence`.
+        """
+        with self._verrou:
+            return self.alertes.depuis(sequence)
+
+    def ventes_par_produit(self, date_debut=None, date_fin=None, categorie=None, sous_categorie=None, produit=None):
+        with self._verrou:
+            return self.cube.par_produit(date_debut, date_fin, categorie, sous_categorie, produit)
+
+    def ventes_par_categorie_et_jour(self, date_debut=None, date_fin=None):
+        with self._verrou:
+            return self.cube.par_categorie_et_jour(date_debut, date_fin)
+
+    def ventes_periode(self, date_debut=None, date_fin=None):
+        """
+        Ventes datées de la période (jours inclus), avec leurs positions pour
+        index, et leurs jetons : (ventes, jetons).
+        """
+        with self._verrou:
+            positions = self.dates.periode(date_debut, date_fin)
+            return self.ventes.iloc[positions], self.jetons_ventes[positions]
+
+    def _attribuer_jetons(self, nombre):
+        jetons = np.arange(self._jeton_suivant, self._jeton_suivant + nombre, dtype=np.int64)
+        self._jeton_suivant += nombre
+        return jetons
+
+    def _renouveler_jetons(self, positions):
+        # Copie à l'écriture : le tableau publié avec la version précédente reste inchangé
+        jetons = self.jetons.copy()
+        jetons[positions] = self._attribuer_jetons(len(positions))
+        self.jetons = jetons
+
+    def _mettre_a_jour_jetons(self, operation, details, ancien_stock, anciennes_ventes):
+        # Nouveau jeton pour chaque ligne modifiée ou ajoutée ; après une suppression,
+        # les lignes décalées gardent le leur (une position lue avant ne correspond plus)
+        if operation == "vente":
+            self.jetons_ventes = np.append(self.jetons_ventes, self._attribuer_jetons(1))
+        elif operation == "ventes_import":
+            self.jetons_ventes = np.append(self.jetons_ventes, self._attribuer_jetons(len(details["lignes"])))
+        elif operation == "vente_suppression":
+            self.jetons_ventes = np.delete(self.jetons_ventes, details["index"])
+        elif self.ventes is not anciennes_ventes:
+            self.jetons_ventes = self._attribuer_jetons(len(self.ventes))
+
+        if operation == "stock_ajout":
+            self.jetons = np.append(self.jetons, self._attribuer_jetons(1))
+        elif operation == "stock_maj":
+            self._renouveler_jetons([details["index"]])
+        elif operation == "stock_suppression":
+            self.jetons = np.delete(self.jetons, details["index"])
+        elif operation == "vente":
+            self._renouveler_jetons([details["stock_index"]])
+        elif operation in ("stock_import", "ventes_import"):
+            positions = [position for position, _ in details["quantites"]]
+            self._renouveler_jetons(positions)
+            if operation == "stock_import":
+                self.jetons = np.append(self.jetons, self._attribuer_jetons(len(details["lignes"])))
+        elif operation == "vente_suppression":
+            # Le stock n'est pas modifié
+            pass
+        elif self.stock is not ancien_stock:
+            self.jetons = self._attribuer_jetons(len(self.stock))
+
+    def _mettre_a_jour_alertes(self, operation, details, ancien_stock):
+        # Seules les lignes touchées sont réévaluées ; sans Quantite_initiale (ou quand
+        # elle vient d'être créée), les quantités initiales changent : recalcul complet
+        if "Quantite_initiale" not in self.stock.columns or "Quantite_initiale" not in ancien_stock.columns:
+            self.alertes.reconstruire(self.stock, self.ventes)
+        elif operation == "stock_ajout":
+            self.alertes.ajouter(self.stock, 1)
+        elif operation == "stock_maj":
+            self.alertes.evaluer(self.stock, [details["index"]])
+        elif operation == "stock_suppression":
+            self.alertes.supprimer(details["index"])
+        elif operation == "vente":
+            self.alertes.evaluer(self.stock, [details["stock_index"]])
+        elif operation in ("stock_import", "ventes_import"):
+            self.alertes.evaluer(self.stock, [position for position, _ in details["quantites"]])
+            if operation == "stock_import" and details["lignes"]:
+                self.alertes.ajouter(self.stock, len(details["lignes"]))
+        elif operation == "vente_suppression":
+            # Le stock n'est pas modifié
+            pass
+        elif self.stock is not ancien_stock:
+            self.alertes.reconstruire(self.stock, self.ventes)
+
+    def _mettre_a_jour_ventes(self, operation, details, anciennes_ventes):
+        # Cube journalier et index des dates
+        if operation == "vente":
+            self.cube.ajouter(details["ligne"])
+            self.dates.ajouter(len(self.ventes) - 1, details["ligne"]["Date"])
+        elif operation == "vente_suppression":
+            self.cube.retirer(anciennes_ventes.iloc[details["index"]])
+            self.dates.supprimer(details["index"])
+        elif operation == "ventes_import":
+            for decalage, ligne in enumerate(details["lignes"]):
+                self.cube.ajouter(ligne)
+                self.dates.ajouter(len(anciennes_ventes) + decalage, ligne["Date"])
+        elif operation not in ("stock_ajout", "stock_maj", "stock_suppression", "stock_import") and self.ventes is not anciennes_ventes:
+            self.cube.reconstruire(self.ventes)
+            self.dates.reconstruire(self.ventes)
+
+    def _valeur_ligne_stock(self, position):
+        return _nombre(self.stock["Prix unitaire"].iat[position]) * _nombre(self.stock["Quantite"].iat[position])
+
+    def _nouveaux_totaux(self, operation, details):
+        """
+        Totaux après l'opération, mis à jour par différence en O(1), ou None
+        si l'opération est inconnue (recalcul complet).
+        """
+        if operation == "stock_ajout":
+            ligne = details["ligne"]
+            return self.totaux.appliquer(valeur_stock=_nombre(ligne["Prix unitaire"]) * _nombre(ligne["Quantite"]))
+        if operation == "stock_maj":
+            ligne = details["ligne"]
+            return self.totaux.appliquer(
+                valeur_stock=_nombre(ligne["Prix unitaire"]) * _nombre(ligne["Quantite"])
+                - self._valeur_ligne_stock(details["index"])
+            )
+        if operation == "stock_suppression":
+            return self.totaux.appliquer(valeur_stock=-self._valeur_ligne_stock(details["index"]))
+        if operation == "vente":
+            position = details["stock_index"]
+            ligne = details["ligne"]
+            ecart_quantite = _nombre(details["quantite_restante"]) - _nombre(self.stock["Quantite"].iat[position])
+            return self.totaux.appliquer(
+                valeur_stock=_nombre(self.stock["Prix unitaire"].iat[position]) * ecart_quantite,
+                montant_ventes=_nombre(ligne["Total"]),
+                unites_vendues=_nombre(ligne["Quantite vendue"]),
+            )
+        if operation == "stock_import":
+            prix = self.stock["Prix unitaire"]
+            quantites = self.stock["Quantite"]
+            return self.totaux.appliquer(valeur_stock=sum(
+                _nombre(prix.iat[position]) * (_nombre(quantite) - _nombre(quantites.iat[position]))
+                for position, quantite in details["quantites"]
+            ) + sum(_nombre(ligne["Prix unitaire"]) * _nombre(ligne["Quantite"]) for ligne in details["lignes"]))
+        if operation == "ventes_import":
+            prix = self.stock["Prix unitaire"]
+            quantites = self.stock["Quantite"]
+            return self.totaux.appliquer(
+                valeur_stock=sum(
+                    _nombre(prix.iat[position]) * (_nombre(restante) - _nombre(quantites.iat[position]))
+                    for position, restante in details["quantites"]
+                ),
+                montant_ventes=sum(_nombre(ligne["Total"]) for ligne in details["lignes"]),
+                unites_vendues=sum(_nombre(ligne["Quantite vendue"]) for ligne in details["lignes"]),
+            )
+        if operation == "vente_suppression":
+            position = details["index"]
+            return self.totaux.appliquer(
+                montant_ventes=-_nombre(self.ventes["Total"].iat[position]),
+                unites_vendues=-_nombre(self.ventes["Quantite vendue"].iat[position]),
+            )
+        return None
+
+    def _mettre_a_jour_index(self, operation, details):
+        if operation not in ("vente", "vente_suppression", "ventes_import"):
+            self.version_catalogue += 1
+        if operation == "stock_ajout":
+            self.index.ajouter(details["ligne"])
+        elif operation == "stock_maj":
+            self.index.modifier(details["index"], details["ligne"])
+        elif operation == "stock_suppression":
+            self.index.supprimer(details["index"])
+        elif operation == "stock_import":
+            # Quantités modifiées sans changer les clés ; seules les lignes nouvelles sont indexées
+            for ligne in details["lignes"]:
+                self.index.ajouter(ligne)
+        elif operation in ("vente", "vente_suppression", "ventes_import"):
+            # Les ventes ne changent pas les clés des produits
+            pass
+        else:
+            self.index.reconstruire(self.stock)
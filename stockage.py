@@ -0,0 +1,876 @@
+import pandas as pd
+import numpy as np
+from datetime import datetime
+import os
+import json
+import sqlite3
+import threading
+import time
+import atexit
+
+# Chemins des fichiers de données
+DATA_DIR = "data"
+STOCK_FILE = os.path.join(DATA_DIR, "stock.csv")
+VENTES_FILE = os.path.join(DATA_DIR, "ventes.csv")
+
+# Journal des mouvements (mode "journal") : une ligne JSON par opération,
+# rejouée au démarrage par-dessus le dernier instantané CSV
+JOURNAL_FILE = os.path.join(DATA_DIR, "journal.jsonl")
+JOURNAL_META_FILE = os.path.join(DATA_DIR, "journal_meta.json")
+
+# Instantané binaire en colonnes (types et dates déjà convertis) écrit à côté des CSV
+INSTANTANE_FILE = os.path.join(DATA_DIR, "instantane.npz")
+
+# Écriture/lecture de l'instantané binaire (désactivée par défaut)
+INSTANTANE_ACTIF = os.environ.get("STOCK_INSTANTANE", "0") == "1"
+
+# Totaux du tableau de bord (valeur du stock, montant et unités vendues) enregistrés avec les CSV
+TOTAUX_FILE = os.path.join(DATA_DIR, "totaux.json")
+
+# Manifeste d'une sauvegarde CSV : fichiers temporaires à renommer ensemble. Son
+# apparition valide la sauvegarde ; au démarrage, une sauvegarde validée est
+# terminée et une sauvegarde interrompue avant validation est abandonnée
+MANIFESTE_FILE = os.path.join(DATA_DIR, "sauvegarde.json")
+SUFFIXE_TEMPORAIRE = ".tmp"
+
+# Base SQLite (mode "sqlite")
+SQLITE_FILE = os.path.join(DATA_DIR, "gestion_stock.db")
+
+# Nombre d'opérations journalisées avant la reconstruction des fichiers CSV
+JOURNAL_SEUIL_COMPACTION = int(os.environ.get("STOCK_JOURNAL_SEUIL", "500"))
+
+# Format des dates dans les fichiers (en mémoire, les colonnes Date sont en datetime64)
+FORMAT_DATE = "%d-%m-%Y"
+
+# Écriture différée : pause (en secondes) attendue après la dernière opération avant
+# d'écrire, et retard maximal de l'opération la plus ancienne en attente
+ECRITURE_INTERVALLE = float(os.environ.get("STOCK_ECRITURE_INTERVALLE", "0.5"))
+ECRITURE_DELAI_MAX = float(os.environ.get("STOCK_ECRITURE_DELAI_MAX", "5"))
+
+# Structure par défaut des DataFrames
+COLONNES_STOCK = ["Categorie", "Sous-categorie", "Produit", "Prix unitaire", "Quantite", "Date", "Quantite_initiale"]
+COLONNES_VENTES = ["Categorie", "Sous-categorie", "Produit", "Prix unitaire", "Quantite vendue", "Date", "Total"]
+
+# Colonnes d'identité des produits, gardées en mémoire sous forme de catégories pandas
+COLONNES_PRODUIT = ["Categorie", "Sous-categorie", "Produit"]
+
+# Création du répertoire de données s'il n'existe pas
+if not os.path.exists(DATA_DIR):
+    os.makedirs(DATA_DIR)
+
+
+def _valeur_json(valeur):
+    """
+    Convertit une valeur pandas/numpy en valeur sérialisable en JSON.
+    """
+    if isinstance(valeur, (pd.Timestamp, datetime)):
+        return valeur.strftime(FORMAT_DATE)
+    if hasattr(valeur, "item"):
+        return valeur.item()
+    return valeur
+
+def _ligne_json(ligne):
+    return {colonne: _valeur_json(valeur) for colonne, valeur in dict(ligne).items()}
+
+def _detail_json(valeur):
+    # Détail d'une opération : ligne, liste de lignes ou de couples, ou valeur simple
+    if isinstance(valeur, (dict, pd.Series)):
+        return _ligne_json(valeur)
+    if isinstance(valeur, (list, tuple)):
+        return [_detail_json(element) for element in valeur]
+    return _valeur_json(valeur)
+
+def convertir_dates(serie):
+    """
+    Convertit une colonne de dates lue sur disque en datetime64, une seule fois
+    au chargement. Format enregistré : "%d-%m-%Y" ; les dates ISO écrites par
+    les anciennes sauvegardes et le format "%d/%m/%Y" sont aussi reconnus.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    texte = serie.astype(str).str.strip()
+    dates = pd.to_datetime(texte, format=FORMAT_DATE, errors="coerce")
+    for format in ("ISO8601", "mixed"):
+        manquantes = dates.isna()
+        if not manquantes.any():
+            break
+        dates[manquantes] = pd.to_datetime(texte[manquantes], format=format, dayfirst=True, errors="coerce")
+    return dates
+
+def encoder_produits(stock_df, ventes_df):
+    """
+    Convertit les colonnes produit du stock et des ventes en catégories pandas
+    partageant le même dictionnaire de valeurs (trié), une fois au chargement :
+    les filtres et regroupements comparent alors des codes entiers.
+    """
+    for colonne in COLONNES_PRODUIT:
+        presentes = [df[colonne] for df in (stock_df, ventes_df) if colonne in df.columns]
+        if not presentes:
+            continue
+        valeurs = pd.unique(pd.concat([serie.astype(object) for serie in presentes], ignore_index=True).dropna())
+        type_categorie = pd.CategoricalDtype(sorted(valeurs, key=str))
+        for df in (stock_df, ventes_df):
+            if colonne in df.columns:
+                df[colonne] = df[colonne].astype(object).astype(type_categorie)
+    return stock_df, ventes_df
+
+def ajouter_categories(df, valeurs):
+    """
+    Ajoute au dictionnaire des colonnes produit de df les valeurs de `valeurs`
+    (dict ou DataFrame) qui n'y sont pas encore, avant une affectation par .loc.
+    """
+    for colonne in COLONNES_PRODUIT:
+        if colonne not in df.columns or colonne not in valeurs:
+            continue
+        if not isinstance(df[colonne].dtype, pd.CategoricalDtype):
+            df[colonne] = df[colonne].astype(object).astype("category")
+        nouvelles = pd.Index(pd.unique(pd.Series(valeurs[colonne], dtype=object).dropna()))
+        nouvelles = nouvelles.difference(df[colonne].cat.categories, sort=False)
+        if len(nouvelles):
+            df[colonne] = df[colonne].cat.add_categories(nouvelles)
+    return df
+
+def concat_lignes(df, lignes):
+    """
+    pd.concat de nouvelles lignes qui garde les colonnes produit en catégories
+    (même dictionnaire des deux côtés ; sinon pandas repasse en texte).
+    """
+    df = ajouter_categories(df.copy(deep=False), lignes)
+    lignes = lignes.copy()
+    for colonne in COLONNES_PRODUIT:
+        if colonne in df.columns and colonne in lignes.columns:
+            lignes[colonne] = lignes[colonne].astype(object).astype(df[colonne].dtype)
+    if df.empty:
+        # Table vide : garder ses types (float, datetime64) plutôt que ceux des lignes
+        # (entiers envoyés par le navigateur), sauf colonnes sans type (CSV d'en-têtes seuls)
+        types = {
+            colonne: df[colonne].dtype
+            for colonne in lignes.columns
+            if colonne in df.columns and df[colonne].dtype != object
+        }
+        return lignes.astype(types).reset_index(drop=True)
+    return pd.concat([df, lignes], ignore_index=True)
+
+def _dataframe_vide(colonnes):
+    # Colonnes typées comme après un chargement : dates en datetime64, nombres en float
+    types = {"Categorie": "category", "Sous-categorie": "category", "Produit": "category", "Date": "datetime64[ns]"}
+    return pd.DataFrame({colonne: pd.Series([], dtype=types.get(colonne, float)) for colonne in colonnes})
+
+
+class Stockage:
+    """
+    Interface commune des backends de persistance.
+
+    - charger() retourne les DataFrames (stock, ventes) et renseigne l'attribut
+      totaux (dictionnaire des totaux enregistrés, ou None s'ils manquent ou
+      ne correspondent plus aux données)
+    - sauvegarder() écrit l'état complet, avec les totaux s'ils sont fournis
+    - enregistrer() persiste une seule opération (par défaut : sauvegarde
+      complète) ; le détail "totaux" contient les totaux après l'opération
+    - enregistrer_lot() persiste une suite d'opérations (stock, ventes,
+      operation, details) en une fois (par défaut : sauvegarde du dernier état)
+    - modifications_en_attente() donne le nombre d'opérations pas encore écrites
+    """
+
+    totaux = None
+
+    def charger(self):
+        raise NotImplementedError
+
+    def sauvegarder(self, stock_df, ventes_df, totaux=None):
+        raise NotImplementedError
+
+    def enregistrer(self, stock_df, ventes_df, operation, **details):
+        self.sauvegarder(stock_df, ventes_df, details.get("totaux"))
+
+    def enregistrer_lot(self, operations):
+        stock_df, ventes_df, _, details = operations[-1]
+        self.sauvegarder(stock_df, ventes_df, details.get("totaux"))
+
+    def modifications_en_attente(self):
+        return 0
+
+
+def _synchroniser_dossier(dossier=DATA_DIR):
+    # Rend les renommages durables (impossible sous Windows, où un dossier ne s'ouvre pas)
+    try:
+        descripteur = os.open(dossier, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descripteur)
+    except OSError:
+        pass
+    finally:
+        os.close(descripteur)
+
+def ecrire_temporaire(chemin, ecrire, binaire=False):
+    """
+    Écrit un fichier sous son nom temporaire avec `ecrire(f)`, le synchronise sur
+    le disque et retourne ce nom ; le fichier définitif n'est pas touché.
+    """
+    temporaire = chemin + SUFFIXE_TEMPORAIRE
+    if binaire:
+        f = open(temporaire, "wb")
+    else:
+        f = open(temporaire, "w", encoding="utf-8", newline="")
+    with f:
+        ecrire(f)
+        f.flush()
+        os.fsync(f.fileno())
+    return temporaire
+
+def valider_fichiers(fichiers, supprimer=()):
+    """
+    Remplace ensemble des fichiers écrits par ecrire_temporaire() : `fichiers`
+    associe chaque nom temporaire au fichier définitif, `supprimer` liste les
+    fichiers devenus obsolètes. Le manifeste est écrit avant les renommages ;
+    après un arrêt brutal, recuperer_sauvegarde() termine le travail.
+    """
+    manifeste = {"fichiers": fichiers, "supprimer": list(supprimer)}
+    temporaire = ecrire_temporaire(MANIFESTE_FILE, lambda f: json.dump(manifeste, f))
+    os.replace(temporaire, MANIFESTE_FILE)
+    _synchroniser_dossier()
+    _terminer_sauvegarde(manifeste)
+
+def _terminer_sauvegarde(manifeste):
+    for temporaire, chemin in manifeste["fichiers"].items():
+        # Fichier temporaire absent : déjà renommé avant l'arrêt
+        if os.path.exists(temporaire):
+            os.replace(temporaire, chemin)
+    for chemin in manifeste["supprimer"]:
+        if os.path.exists(chemin):
+            os.remove(chemin)
+    _synchroniser_dossier()
+    os.remove(MANIFESTE_FILE)
+
+def recuperer_sauvegarde():
+    """
+    Termine ou abandonne une sauvegarde interrompue par un arrêt brutal : avec
+    un manifeste, les renommages restants sont faits ; sans manifeste, les
+    fichiers temporaires sont supprimés et les anciens fichiers restent en
+    place. Retourne "terminee", "abandonnee" ou None si rien n'était en cours.
+    """
+    if os.path.exists(MANIFESTE_FILE):
+        with open(MANIFESTE_FILE, encoding="utf-8") as f:
+            _terminer_sauvegarde(json.load(f))
+        return "terminee"
+    restes = [
+        chemin + SUFFIXE_TEMPORAIRE
+        for chemin in (STOCK_FILE, VENTES_FILE, INSTANTANE_FILE, TOTAUX_FILE, JOURNAL_META_FILE, MANIFESTE_FILE)
+        if os.path.exists(chemin + SUFFIXE_TEMPORAIRE)
+    ]
+    for temporaire in restes:
+        os.remove(temporaire)
+    return "abandonnee" if restes else None
+
+
+def tableaux_instantane(stock_df, ventes_df):
+    """
+    Colonnes des deux DataFrames pour un fichier .npz : nombres en float64,
+    dates en datetime64, textes en chaînes numpy (sans pickle).
+    """
+    tableaux = {}
+    for nom, df in (("stock", stock_df), ("ventes", ventes_df)):
+        tableaux[f"{nom}__colonnes"] = np.array(list(df.columns), dtype=str)
+        for colonne in df.columns:
+            serie = df[colonne]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                # Dictionnaire + codes entiers : l'encodage est relu tel quel
+                tableaux[f"{nom}__{colonne}__categories"] = serie.cat.categories.astype(str).to_numpy(dtype=str)
+                valeurs = serie.cat.codes.to_numpy()
+            elif pd.api.types.is_datetime64_any_dtype(serie):
+                valeurs = serie.to_numpy(dtype="datetime64[ns]")
+            elif pd.api.types.is_numeric_dtype(serie):
+                valeurs = serie.to_numpy(dtype=float)
+            else:
+                valeurs = serie.astype(str).to_numpy(dtype=str)
+            tableaux[f"{nom}__{colonne}"] = valeurs
+    return tableaux
+
+def ecrire_instantane(stock_df, ventes_df, chemin=INSTANTANE_FILE):
+    """
+    Écrit les deux DataFrames dans un fichier .npz colonne par colonne, sous
+    son nom temporaire ; retourne ce nom, à valider par valider_fichiers().
+    """
+    tableaux = tableaux_instantane(stock_df, ventes_df)
+    return ecrire_temporaire(chemin, lambda f: np.savez(f, **tableaux), binaire=True)
+
+def lire_instantane(chemin=INSTANTANE_FILE):
+    """
+    Relit un instantané écrit par ecrire_instantane() sans aucune conversion de type.
+    """
+    with np.load(chemin, allow_pickle=False) as donnees:
+        resultat = []
+        for nom in ("stock", "ventes"):
+            colonnes = donnees[f"{nom}__colonnes"].tolist()
+            df = {}
+            for colonne in colonnes:
+                valeurs = donnees[f"{nom}__{colonne}"]
+                if f"{nom}__{colonne}__categories" in donnees:
+                    valeurs = pd.Categorical.from_codes(valeurs, categories=donnees[f"{nom}__{colonne}__categories"])
+                df[colonne] = valeurs
+            resultat.append(pd.DataFrame(df, columns=colonnes))
+    return resultat[0], resultat[1]
+
+
+class StockageCSV(Stockage):
+    """
+    Persistance historique : deux fichiers CSV réécrits en entier, avec en
+    option un instantané binaire utilisé au démarrage tant qu'il est plus récent
+    que les CSV.
+    """
+
+    def __init__(self, instantane=INSTANTANE_ACTIF):
+        self.instantane = instantane
+
+    def instantane_a_jour(self):
+        """
+        Vrai si l'instantané existe et n'est pas plus ancien que les fichiers CSV.
+        """
+        if not self.instantane or not os.path.exists(INSTANTANE_FILE):
+            return False
+        date_instantane = os.path.getmtime(INSTANTANE_FILE)
+        for fichier in (STOCK_FILE, VENTES_FILE):
+            if os.path.exists(fichier) and os.path.getmtime(fichier) > date_instantane:
+                return False
+        return True
+
+    @staticmethod
+    def lire_totaux():
+        """
+        Totaux enregistrés, ou None s'ils sont absents ou plus anciens que les CSV.
+        """
+        if not os.path.exists(TOTAUX_FILE):
+            return None
+        date_totaux = os.path.getmtime(TOTAUX_FILE)
+        for fichier in (STOCK_FILE, VENTES_FILE):
+            if os.path.exists(fichier) and os.path.getmtime(fichier) > date_totaux:
+                return None
+        try:
+            with open(TOTAUX_FILE, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def charger(self):
+        etat = recuperer_sauvegarde()
+        if etat == "terminee":
+            print("Sauvegarde interrompue : fichiers validés remis en place.")
+        elif etat == "abandonnee":
+            print("Sauvegarde interrompue avant validation : fichiers précédents conservés.")
+
+        self.totaux = self.lire_totaux()
+        if self.instantane_a_jour():
+            try:
+                return lire_instantane()
+            except (OSError, KeyError, ValueError):
+                # Instantané illisible : retour aux CSV
+                pass
+
+        # Charger les données du stock
+        if os.path.exists(STOCK_FILE):
+            stock_df = pd.read_csv(STOCK_FILE)
+            stock_df = stock_df.fillna(0)
+            if "Prix unitaire" in stock_df.columns:
+                stock_df["Prix unitaire"] = stock_df["Prix unitaire"].astype(float)
+            if "Quantite" in stock_df.columns:
+                stock_df["Quantite"] = stock_df["Quantite"].astype(float)
+            if "Quantite_initiale" in stock_df.columns:
+                stock_df["Quantite_initiale"] = stock_df["Quantite_initiale"].astype(float)
+            if "Date" in stock_df.columns:
+                stock_df["Date"] = convertir_dates(stock_df["Date"])
+        else:
+            stock_df = _dataframe_vide(COLONNES_STOCK)
+
+        # Charger les données des ventes
+        if os.path.exists(VENTES_FILE):
+            ventes_df = pd.read_csv(VENTES_FILE)
+            ventes_df = ventes_df.fillna(0)
+            if "Date" in ventes_df.columns:
+                ventes_df["Date"] = convertir_dates(ventes_df["Date"])
+        else:
+            ventes_df = _dataframe_vide(COLONNES_VENTES)
+
+        return encoder_produits(stock_df, ventes_df)
+
+    def sauvegarder(self, stock_df, ventes_df, totaux=None):
+        # Tous les fichiers sont écrits sous un nom temporaire, puis validés ensemble :
+        # un arrêt brutal ne laisse jamais un CSV tronqué ni stock et ventes désaccordés
+        fichiers, supprimer = self.preparer_fichiers(stock_df, ventes_df, totaux)
+        valider_fichiers(fichiers, supprimer)
+
+    def preparer_fichiers(self, stock_df, ventes_df, totaux=None):
+        """
+        Écrit les fichiers d'une sauvegarde sous leur nom temporaire. Retourne
+        ({temporaire: définitif}, fichiers à supprimer) pour valider_fichiers().
+        """
+        fichiers = {}
+
+        # Stock puis ventes (dates mises en forme ici seulement)
+        for df, chemin in ((stock_df, STOCK_FILE), (ventes_df, VENTES_FILE)):
+            temporaire = ecrire_temporaire(chemin, lambda f: df.to_csv(f, index=False, date_format=FORMAT_DATE))
+            fichiers[temporaire] = chemin
+
+        # Instantané binaire écrit après les CSV, donc plus récent qu'eux
+        if self.instantane:
+            fichiers[ecrire_instantane(stock_df, ventes_df)] = INSTANTANE_FILE
+
+        # Totaux écrits en dernier ; sans totaux, l'ancien fichier ne correspond plus
+        if totaux is not None:
+            fichiers[ecrire_temporaire(TOTAUX_FILE, lambda f: json.dump(totaux, f))] = TOTAUX_FILE
+            return fichiers, []
+        return fichiers, [TOTAUX_FILE]
+
+
+class StockageJournal(StockageCSV):
+    """
+    CSV + journal en ajout seul : chaque opération coûte une ligne JSON, les CSV
+    ne sont reconstruits que lors de la compaction.
+    """
+
+    def __init__(self, seuil_compaction=JOURNAL_SEUIL_COMPACTION, instantane=INSTANTANE_ACTIF):
+        super().__init__(instantane)
+        self.seuil_compaction = seuil_compaction
+        # Dernier numéro de séquence écrit et nombre d'opérations en attente
+        self.sequence = 0
+        self.taille = 0
+
+    def sauvegarder(self, stock_df, ventes_df, totaux=None):
+        super().sauvegarder(stock_df, ventes_df, totaux)
+        # Les CSV contiennent désormais toutes les opérations du journal
+        self.vider_journal()
+
+    def preparer_fichiers(self, stock_df, ventes_df, totaux=None):
+        # La séquence couverte par les CSV est validée avec eux : jamais
+        # d'opération rejouée deux fois ni perdue après un arrêt brutal
+        fichiers, supprimer = super().preparer_fichiers(stock_df, ventes_df, totaux)
+        meta = {"sequence": self.sequence}
+        fichiers[ecrire_temporaire(JOURNAL_META_FILE, lambda f: json.dump(meta, f))] = JOURNAL_META_FILE
+        return fichiers, supprimer
+
+    def vider_journal(self):
+        """
+        Vide le journal une fois ses opérations couvertes par les CSV validés
+        (les entrées déjà couvertes seraient de toute façon ignorées au rejeu).
+        """
+        open(JOURNAL_FILE, "w", encoding="utf-8").close()
+        self.taille = 0
+
+    def journaliser(self, operation, **details):
+        """
+        Ajoute une opération en fin de journal (une seule ligne JSON, coût constant).
+        """
+        self.journaliser_lot([(operation, details)])
+
+    def journaliser_lot(self, operations):
+        """
+        Ajoute plusieurs opérations (operation, details) au journal avec un seul fsync.
+        """
+        lignes = []
+        for operation, details in operations:
+            self.sequence += 1
+            entree = {"sequence": self.sequence, "operation": operation}
+            for cle, valeur in details.items():
+                entree[cle] = _detail_json(valeur)
+            lignes.append(json.dumps(entree, ensure_ascii=False) + "\n")
+        with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(lignes))
+            f.flush()
+            os.fsync(f.fileno())
+        self.taille += len(lignes)
+
+    def enregistrer(self, stock_df, ventes_df, operation, **details):
+        self.enregistrer_lot([(stock_df, ventes_df, operation, details)])
+
+    def enregistrer_lot(self, operations):
+        self.journaliser_lot([(operation, details) for _, _, operation, details in operations])
+        if self.taille >= self.seuil_compaction:
+            stock_df, ventes_df, _, details = operations[-1]
+            self.compacter(stock_df, ventes_df, details.get("totaux"))
+
+    def compacter(self, stock_df, ventes_df, totaux=None):
+        """
+        Reconstruit les fichiers CSV complets et repart d'un journal vide.
+        """
+        self.sauvegarder(stock_df, ventes_df, totaux)
+
+    def charger(self):
+        stock_df, ventes_df = super().charger()
+        return self.rejouer(stock_df, ventes_df)
+
+    def rejouer(self, stock_df, ventes_df):
+        """
+        Applique les opérations du journal postérieures au dernier instantané CSV.
+        """
+        sequence_instantane = 0
+        if os.path.exists(JOURNAL_META_FILE):
+            with open(JOURNAL_META_FILE, encoding="utf-8") as f:
+                sequence_instantane = json.load(f).get("sequence", 0)
+        self.sequence = sequence_instantane
+        self.taille = 0
+        if not os.path.exists(JOURNAL_FILE):
+            return stock_df, ventes_df
+
+        entrees = []
+        with open(JOURNAL_FILE, encoding="utf-8") as f:
+            for ligne in f:
+                ligne = ligne.strip()
+                if not ligne:
+                    continue
+                try:
+                    entree = json.loads(ligne)
+                except json.JSONDecodeError:
+                    # Dernière ligne tronquée par un arrêt brutal : on l'ignore
+                    break
+                if entree["sequence"] > sequence_instantane:
+                    entrees.append(entree)
+        if not entrees:
+            return stock_df, ventes_df
+
+        # Rejouer sur des listes de lignes pour éviter un pd.concat par opération
+        colonnes_stock = list(stock_df.columns)
+        colonnes_ventes = list(ventes_df.columns)
+        stock_lignes = stock_df.to_dict("records")
+        ventes_lignes = ventes_df.to_dict("records")
+        for entree in entrees:
+            operation = entree["operation"]
+            for ligne in [entree["ligne"]] if "ligne" in entree else entree.get("lignes", []):
+                if "Date" in ligne:
+                    ligne["Date"] = pd.to_datetime(ligne["Date"], format=FORMAT_DATE, errors="coerce")
+            if operation == "stock_ajout":
+                stock_lignes.append(entree["ligne"])
+            elif operation == "stock_maj":
+                stock_lignes[entree["index"]] = entree["ligne"]
+            elif operation == "stock_suppression":
+                del stock_lignes[entree["index"]]
+            elif operation == "stock_import":
+                for position, quantite in entree["quantites"]:
+                    stock_lignes[position]["Quantite"] = quantite
+                stock_lignes.extend(entree["lignes"])
+            elif operation == "vente":
+                ventes_lignes.append(entree["ligne"])
+                stock_lignes[entree["stock_index"]]["Quantite"] = entree["quantite_restante"]
+            elif operation == "ventes_import":
+                ventes_lignes.extend(entree["lignes"])
+                for position, quantite in entree["quantites"]:
+                    stock_lignes[position]["Quantite"] = quantite
+            elif operation == "vente_suppression":
+                del ventes_lignes[entree["index"]]
+            # Chaque entrée porte les totaux après l'opération
+            self.totaux = entree.get("totaux")
+            self.sequence = entree["sequence"]
+            self.taille += 1
+
+        stock_df = pd.DataFrame(stock_lignes, columns=colonnes_stock or None)
+        ventes_df = pd.DataFrame(ventes_lignes, columns=colonnes_ventes or None)
+        for df in (stock_df, ventes_df):
+            if "Date" in df.columns:
+                df["Date"] = pd.to_datetime(df["Date"])
+        return encoder_produits(stock_df, ventes_df)
+
+
+class StockageSQLite(Stockage):
+    """
+    Base SQLite embarquée (mode WAL) : chaque opération est une transaction
+    d'une seule ligne. Les lignes ne sont relues qu'au chargement, dans l'ordre
+    de leur identifiant (les agrégats du tableau de bord viennent du cube de
+    ventes du magasin, en mémoire).
+    """
+
+    # Correspondance colonnes DataFrame -> colonnes SQL
+    SQL_STOCK = {
+        "Categorie": "categorie",
+        "Sous-categorie": "sous_categorie",
+        "Produit": "produit",
+        "Prix unitaire": "prix_unitaire",
+        "Quantite": "quantite",
+        "Date": "date",
+        "Quantite_initiale": "quantite_initiale",
+    }
+    SQL_VENTES = {
+        "Categorie": "categorie",
+        "Sous-categorie": "sous_categorie",
+        "Produit": "produit",
+        "Prix unitaire": "prix_unitaire",
+        "Quantite vendue": "quantite_vendue",
+        "Date": "date",
+        "Total": "total",
+    }
+
+    def __init__(self, chemin=SQLITE_FILE):
+        self.chemin = chemin
+        self.connexion = sqlite3.connect(chemin, check_same_thread=False)
+        self.connexion.execute("PRAGMA journal_mode=WAL")
+        self.connexion.execute("PRAGMA synchronous=NORMAL")
+        self.connexion.executescript("""
+            CREATE TABLE IF NOT EXISTS stock (
+                id INTEGER PRIMARY KEY,
+                categorie TEXT, sous_categorie TEXT, produit TEXT,
+                prix_unitaire REAL, quantite REAL, date TEXT, quantite_initiale REAL
+            );
+            CREATE TABLE IF NOT EXISTS ventes (
+                id INTEGER PRIMARY KEY,
+                categorie TEXT, sous_categorie TEXT, produit TEXT,
+                prix_unitaire REAL, quantite_vendue REAL, date TEXT, total REAL
+            );
+            -- Aucune requête ne filtre par produit ou par date : pas d'index à maintenir à chaque insertion
+            DROP INDEX IF EXISTS idx_stock_produit;
+            DROP INDEX IF EXISTS idx_ventes_produit;
+            DROP INDEX IF EXISTS idx_ventes_date;
+            CREATE TABLE IF NOT EXISTS totaux (nom TEXT PRIMARY KEY, valeur REAL);
+            CREATE TABLE IF NOT EXISTS meta (nom TEXT PRIMARY KEY, valeur TEXT);
+        """)
+        # Identifiants SQL des lignes, dans l'ordre des positions des DataFrames
+        self.ids_stock = []
+        self.ids_ventes = []
+
+    @staticmethod
+    def _date_vente_sql(valeur):
+        # Dates de vente au format ISO (relu tel quel par charger()), triable pour un outil SQL externe
+        if isinstance(valeur, str):
+            valeur = pd.to_datetime(valeur, format=FORMAT_DATE)
+        return pd.Timestamp(valeur).strftime("%Y-%m-%d")
+
+    def _valeurs(self, ligne, correspondance, table):
+        valeurs = []
+        for colonne in correspondance:
+            valeur = _valeur_json(ligne.get(colonne, 0))
+            if table == "ventes" and colonne == "Date":
+                valeur = self._date_vente_sql(ligne[colonne])
+            valeurs.append(valeur)
+        return valeurs
+
+    def _inserer(self, table, ligne):
+        correspondance = self.SQL_STOCK if table == "stock" else self.SQL_VENTES
+        colonnes = ", ".join(correspondance.values())
+        marqueurs = ", ".join("?" for _ in correspondance)
+        curseur = self.connexion.execute(
+            f"INSERT INTO {table} ({colonnes}) VALUES ({marqueurs})",
+            self._valeurs(ligne, correspondance, table),
+        )
+        return curseur.lastrowid
+
+    def _ecrire_totaux(self, totaux):
+        # Même transaction que l'opération : les totaux suivent toujours les données
+        self.connexion.execute("DELETE FROM totaux")
+        if totaux is not None:
+            self.connexion.executemany(
+                "INSERT INTO totaux (nom, valeur) VALUES (?, ?)", list(totaux.items())
+            )
+
+    def _migration_faite(self):
+        return self.connexion.execute(
+            "SELECT 1 FROM meta WHERE nom = 'migration_csv'"
+        ).fetchone() is not None
+
+    def _marquer_migration(self):
+        with self.connexion:
+            self.connexion.execute("INSERT OR REPLACE INTO meta (nom, valeur) VALUES ('migration_csv', ?)",
+                                   (datetime.now().isoformat(timespec="seconds"),))
+
+    def charger(self):
+        if not self._migration_faite():
+            # Premier chargement de la base : importer les CSV existants une seule fois.
+            # Une base déjà remplie (créée avant la table meta) est marquée sans import.
+            nb_stock = self.connexion.execute("SELECT COUNT(*) FROM stock").fetchone()[0]
+            nb_ventes = self.connexion.execute("SELECT COUNT(*) FROM ventes").fetchone()[0]
+            if nb_stock == 0 and nb_ventes == 0 and (os.path.exists(STOCK_FILE) or os.path.exists(VENTES_FILE)):
+                stock_df, ventes_df = StockageCSV().charger()
+                # Interrompu avant le marquage, l'import est simplement refait (sauvegarder remplace tout)
+                self.sauvegarder(stock_df, ventes_df)
+                self._marquer_migration()
+                self.totaux = None
+                return stock_df, ventes_df
+            self._marquer_migration()
+
+        self.totaux = dict(self.connexion.execute("SELECT nom, valeur FROM totaux").fetchall()) or None
+
+        stock_sql = pd.read_sql_query(
+            f"SELECT id, {', '.join(self.SQL_STOCK.values())} FROM stock ORDER BY id", self.connexion
+        )
+        ventes_sql = pd.read_sql_query(
+            f"SELECT id, {', '.join(self.SQL_VENTES.values())} FROM ventes ORDER BY id", self.connexion
+        )
+        self.ids_stock = stock_sql.pop("id").tolist()
+        self.ids_ventes = ventes_sql.pop("id").tolist()
+        stock_df = stock_sql.rename(columns={v: k for k, v in self.SQL_STOCK.items()})
+        ventes_df = ventes_sql.rename(columns={v: k for k, v in self.SQL_VENTES.items()})
+        stock_df = stock_df.fillna(0)
+        stock_df["Date"] = convertir_dates(stock_df["Date"])
+        ventes_df["Date"] = pd.to_datetime(ventes_df["Date"], format="%Y-%m-%d")
+        return encoder_produits(stock_df, ventes_df)
+
+    def sauvegarder(self, stock_df, ventes_df, totaux=None):
+        with self.connexion:
+            self.connexion.execute("DELETE FROM stock")
+            self.connexion.execute("DELETE FROM ventes")
+            self.ids_stock = [self._inserer("stock", ligne) for ligne in stock_df.to_dict("records")]
+            self.ids_ventes = [self._inserer("ventes", ligne) for ligne in ventes_df.to_dict("records")]
+            self._ecrire_totaux(totaux)
+
+    def enregistrer(self, stock_df, ventes_df, operation, **details):
+        with self.connexion:
+            self._appliquer(operation, details)
+
+    def enregistrer_lot(self, operations):
+        # Toutes les opérations du lot dans une seule transaction
+        with self.connexion:
+            for _, _, operation, details in operations:
+                self._appliquer(operation, details)
+
+    def _appliquer(self, operation, details):
+        if operation == "stock_ajout":
+            self.ids_stock.append(self._inserer("stock", dict(details["ligne"])))
+        elif operation == "stock_maj":
+            ligne = dict(details["ligne"])
+            affectations = ", ".join(f"{colonne} = ?" for colonne in self.SQL_STOCK.values())
+            self.connexion.execute(
+                f"UPDATE stock SET {affectations} WHERE id = ?",
+                self._valeurs(ligne, self.SQL_STOCK, "stock") + [self.ids_stock[details["index"]]],
+            )
+        elif operation == "stock_suppression":
+            self.connexion.execute("DELETE FROM stock WHERE id = ?", (self.ids_stock.pop(details["index"]),))
+        elif operation == "stock_import":
+            self.connexion.executemany(
+                "UPDATE stock SET quantite = ? WHERE id = ?",
+                [(_valeur_json(quantite), self.ids_stock[position]) for position, quantite in details["quantites"]],
+            )
+            self.ids_stock.extend(self._inserer("stock", dict(ligne)) for ligne in details["lignes"])
+        elif operation == "vente":
+            self.ids_ventes.append(self._inserer("ventes", dict(details["ligne"])))
+            self.connexion.execute(
+                "UPDATE stock SET quantite = ? WHERE id = ?",
+                (_valeur_json(details["quantite_restante"]), self.ids_stock[details["stock_index"]]),
+            )
+        elif operation == "ventes_import":
+            self.ids_ventes.extend(self._inserer("ventes", dict(ligne)) for ligne in details["lignes"])
+            self.connexion.executemany(
+                "UPDATE stock SET quantite = ? WHERE id = ?",
+                [(_valeur_json(quantite), self.ids_stock[position]) for position, quantite in details["quantites"]],
+            )
+        elif operation == "vente_suppression":
+            self.connexion.execute("DELETE FROM ventes WHERE id = ?", (self.ids_ventes.pop(details["index"]),))
+        else:
+            raise ValueError(f"Opération inconnue : {operation}")
+        if "totaux" in details:
+            self._ecrire_totaux(details["totaux"])
+
+
+class StockageDiffere(Stockage):
+    """
+    Écriture différée devant un autre backend : enregistrer() met l'opération en
+    file et rend la main aussitôt ; un fil d'écriture attend une pause de
+    `intervalle` secondes (au plus `delai_max` secondes après l'opération la
+    plus ancienne) puis écrit toute la file d'un coup avec enregistrer_lot().
+    La file est vidée à l'arrêt du processus.
+    """
+
+    def __init__(self, stockage, intervalle=ECRITURE_INTERVALLE, delai_max=ECRITURE_DELAI_MAX):
+        self.stockage = stockage
+        self.intervalle = intervalle
+        self.delai_max = delai_max
+        self._condition = threading.Condition()
+        # Un seul écrivain à la fois : l'ordre des opérations est conservé
+        self._ecriture = threading.Lock()
+        self._file = []
+        self._en_cours = 0
+        self._premiere = self._derniere = 0.0
+        self._arret = False
+        self._fil = threading.Thread(target=self._boucle, name="ecriture-differee", daemon=True)
+        self._fil.start()
+        atexit.register(self.arreter)
+
+    @property
+    def totaux(self):
+        return self.stockage.totaux
+
+    def charger(self):
+        return self.stockage.charger()
+
+    def sauvegarder(self, stock_df, ventes_df, totaux=None):
+        # L'état complet remplace les opérations encore en file
+        with self._ecriture:
+            with self._condition:
+                self._file = []
+            self.stockage.sauvegarder(stock_df, ventes_df, totaux)
+
+    def enregistrer(self, stock_df, ventes_df, operation, **details):
+        with self._condition:
+            maintenant = time.monotonic()
+            if not self._file:
+                self._premiere = maintenant
+            self._derniere = maintenant
+            self._file.append((stock_df, ventes_df, operation, details))
+            self._condition.notify()
+
+    def modifications_en_attente(self):
+        with self._condition:
+            return len(self._file) + self._en_cours
+
+    def vider(self):
+        """
+        Écrit immédiatement toutes les opérations en file.
+        """
+        with self._ecriture:
+            with self._condition:
+                lot, self._file = self._file, []
+                self._en_cours = len(lot)
+            try:
+                if lot:
+                    self.stockage.enregistrer_lot(lot)
+            except Exception as erreur:
+                # Lot remis en tête de file : nouvel essai à la prochaine écriture
+                print(f"Erreur d'écriture différée : {erreur}")
+                with self._condition:
+                    self._file = lot + self._file
+                    self._premiere = time.monotonic()
+                raise
+            finally:
+                with self._condition:
+                    self._en_cours = 0
+
+    def _boucle(self):
+        while True:
+            with self._condition:
+                while not self._file and not self._arret:
+                    self._condition.wait()
+                if self._arret:
+                    return
+                # Regrouper une rafale : attendre une pause, sans dépasser le délai maximal
+                while not self._arret:
+                    echeance = min(self._derniere + self.intervalle, self._premiere + self.delai_max)
+                    reste = echeance - time.monotonic()
+                    if reste <= 0:
+                        break
+                    self._condition.wait(reste)
+            try:
+                self.vider()
+            except Exception:
+                time.sleep(self.intervalle)
+
+    def arreter(self):
+        """
+        Arrête le fil d'écriture puis écrit ce qui reste en file.
+        """
+        with self._condition:
+            self._arret = True
+            self._condition.notify()
+        self._fil.join()
+        self.vider()
+
+
+def creer_stockage(mode="csv", differe=False):
+    """
+    Retourne le backend de persistance correspondant au mode ("csv", "journal"
+    ou "sqlite"), précédé d'une écriture différée si `differe` est vrai.
+    """
+    if mode == "journal":
+        stockage = StockageJournal()
+    elif mode == "sqlite":
+        stockage = StockageSQLite()
+    elif mode == "csv":
+        stockage = StockageCSV()
+    else:
+        raise ValueError(f"Mode de persistance inconnu : {mode}")
+    return StockageDiffere(stockage) if differe else stockage
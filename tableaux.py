@@ -0,0 +1,86 @@
+import html
+import re
+
+import numpy as np
+import pandas as pd
+
+# Caractères à échapper dans le contenu des cellules
+_A_ECHAPPER = re.compile(r"[&<>\"']")
+
+
+# Mise en forme de colonnes entières : chaque fonction prend une Series et
+# retourne un tableau numpy de chaînes, une par ligne. Chaque valeur distincte
+# n'est mise en forme qu'une seule fois (pd.factorize), puis recopiée par
+# indexation numpy : catégories, dates et prix se répètent beaucoup.
+
+def _par_valeur(serie, fonction):
+    codes, valeurs = pd.factorize(serie, use_na_sentinel=False)
+    formatees = np.array([fonction(valeur) for valeur in valeurs], dtype=object)
+    return formatees[codes] if len(codes) else formatees
+
+def texte(serie):
+    """
+    Valeurs converties en texte, échappées pour le HTML seulement si nécessaire.
+    """
+    def formater(valeur):
+        valeur = str(valeur)
+        return html.escape(valeur) if _A_ECHAPPER.search(valeur) else valeur
+    return _par_valeur(serie, formater)
+
+def nombre(serie):
+    # Même rendu que str(valeur), par exemple 12.0
+    return _par_valeur(serie, str)
+
+def montant(serie):
+    return _par_valeur(serie, lambda valeur: f"{float(valeur):.2f} Fbu")
+
+def date(serie, format="%d-%m-%Y"):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return _par_valeur(serie, lambda valeur: valeur.strftime(format) if pd.notna(valeur) else "")
+    return texte(serie)
+
+def pourcentage(serie):
+    return _par_valeur(serie, lambda valeur: f'<span class="stock-percentage">{valeur}%</span>')
+
+def action(index, identifiant, libelle, classe, balise="span"):
+    """
+    Bouton ou icône qui envoie la valeur d'index de la ligne (position ou
+    jeton) à l'entrée Shiny `identifiant`.
+    """
+    attribut_classe = f' class="{classe}"' if classe else ""
+    # Un seul formatage % par ligne : plus rapide qu'une concaténation de tableaux
+    # object colonne par colonne (une chaîne intermédiaire par morceau et par ligne)
+    modele = (
+        f"<{balise}{attribut_classe} data-index=\"%s\" "
+        f"onclick=\"Shiny.setInputValue('{identifiant}', %s, {{priority: 'event'}});\">{libelle}</{balise}>"
+    )
+    return np.array([modele % (valeur, valeur) for valeur in index.tolist()], dtype=object)
+
+
+def lignes_html(cellules, classe_ligne=None):
+    """
+    Construit les <tr> d'un tableau à partir d'une liste de colonnes de cellules
+    déjà mises en forme (toutes de même longueur), jointes en une seule passe.
+    """
+    if not cellules or len(cellules[0]) == 0:
+        return ""
+    ouverture = f'<tr class="{classe_ligne}">' if classe_ligne else "<tr>"
+    # Modèle % appliqué ligne par ligne (une seule allocation par ligne) : les
+    # variantes par colonnes (objets +, np.strings.add, str.cat) sont plus lentes
+    modele = ouverture + "<td>" + "</td><td>".join(["%s"] * len(cellules)) + "</td></tr>"
+    return "\n".join([modele % ligne for ligne in zip(*cellules)])
+
+def tableau_html(entetes, cellules, classe="table table-striped table-bordered", classe_ligne=None, responsive=True):
+    """
+    Tableau HTML complet : en-têtes, lignes générées par lignes_html(), et
+    enveloppe <div class="table-responsive"> si demandé.
+    """
+    entete = "".join(f"<th>{titre}</th>" for titre in entetes)
+    html_tableau = (
+        f'<table class="{classe}"><thead><tr>{entete}</tr></thead><tbody>\n'
+        + lignes_html(cellules, classe_ligne)
+        + "\n</tbody></table>"
+    )
+    if responsive:
+        html_tableau = f'<div class="table-responsive">{html_tableau}</div>'
+    return html_tableau
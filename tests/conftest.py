@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules de l'application à la racine du dépôt (comme benchmarks/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+
+from stockage import (
+    COLONNES_STOCK, COLONNES_VENTES, DATA_DIR, StockageCSV, StockageSQLite, _dataframe_vide, concat_lignes,
+)
+
+
+def test_concat_lignes_stock_vide_garde_les_types():
+    # Prix et quantité entiers, comme envoyés par le navigateur
+    nouvelle_ligne = pd.DataFrame({
+        "Categorie": ["A"],
+        "Sous-categorie": ["a"],
+        "Produit": ["x"],
+        "Prix unitaire": [10],
+        "Quantite": [3],
+        "Date": [pd.Timestamp("2024-01-01")],
+        "Quantite_initiale": [3],
+    })
+    stock = concat_lignes(_dataframe_vide(COLONNES_STOCK), nouvelle_ligne)
+
+    assert stock["Prix unitaire"].dtype == float
+    assert stock["Quantite"].dtype == float
+    assert stock["Quantite_initiale"].dtype == float
+    assert stock["Date"].dtype == "datetime64[ns]"
+    assert isinstance(stock["Produit"].dtype, pd.CategoricalDtype)
+    assert stock["Produit"].tolist() == ["x"]
+    assert isinstance(stock["Prix unitaire"].iat[0].item(), float)
+
+
+def test_concat_lignes_ventes_vides_garde_les_types():
+    nouvelle_vente = pd.DataFrame({
+        "Categorie": ["A"],
+        "Sous-categorie": ["a"],
+        "Produit": ["x"],
+        "Prix unitaire": [10],
+        "Quantite vendue": [2],
+        "Date": [pd.Timestamp("2024-01-01")],
+        "Total": [20],
+    })
+    ventes = concat_lignes(_dataframe_vide(COLONNES_VENTES), nouvelle_vente)
+
+    assert ventes["Prix unitaire"].dtype == float
+    assert ventes["Quantite vendue"].dtype == float
+    assert ventes["Total"].dtype == float
+    assert ventes.index.tolist() == [0]
+
+
+def test_sqlite_importe_les_csv_une_seule_fois(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(DATA_DIR)
+    stock = concat_lignes(_dataframe_vide(COLONNES_STOCK), pd.DataFrame({
+        "Categorie": ["A"],
+        "Sous-categorie": ["a"],
+        "Produit": ["x"],
+        "Prix unitaire": [10.0],
+        "Quantite": [3.0],
+        "Date": [pd.Timestamp("2024-01-01")],
+        "Quantite_initiale": [3.0],
+    }))
+    StockageCSV(instantane=False).sauvegarder(stock, _dataframe_vide(COLONNES_VENTES))
+
+    base = StockageSQLite(str(tmp_path / "stock.db"))
+    stock_charge, _ = base.charger()
+    assert stock_charge["Produit"].tolist() == ["x"]
+
+    # Tout supprimer puis recharger : les CSV, toujours présents, ne sont pas réimportés
+    base.enregistrer(stock_charge, None, "stock_suppression", index=0)
+    stock_recharge, ventes_rechargees = StockageSQLite(str(tmp_path / "stock.db")).charger()
+    assert stock_recharge.empty
+    assert ventes_rechargees.empty